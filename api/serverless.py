@@ -0,0 +1,125 @@
+# Serverless entry point (see vercel.json) for the dashboard in api/index.py
+#
+# Cold starts only import Dash and read the response bundle written at deploy
+# time by `python -m growth.bundle api/index.py`. Unfiltered analyses are served
+# straight from the bundle. The full app (pandas, plotly.express and the CSV)
+# is imported on the first request the bundle cannot answer, i.e. the first
+# filtered one. A bundle built from other data or code is not used: the full
+# app is imported at startup and answers every request. Startup timings are
+# logged and served at /metrics.
+import time
+
+_started = time.perf_counter()
+
+import importlib
+import os
+import sys
+import threading
+
+import dash
+from dash import dcc, html
+from dash.dependencies import Input, Output
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Make the shared `growth` package importable when run from this directory
+sys.path.insert(0, os.path.dirname(HERE))
+from growth.bundle import BUNDLE_NAME, DATA_FILE, load_bundle
+from growth.controls import filter_controls, filter_options
+from growth.figure_cache import enable_layout_etags
+from growth.metrics import CallbackMetrics, register_metrics_routes
+
+# Like gunicorn.conf.py: the full app reads its CSV from the working directory
+os.chdir(HERE)
+
+callback_metrics = CallbackMetrics()
+callback_metrics.record_startup('import', time.perf_counter() - _started)
+
+_full_app = None
+_full_app_lock = threading.Lock()
+
+
+def full_app():
+    """The api/index.py module, imported on first use."""
+    global _full_app
+    with _full_app_lock:
+        if _full_app is None:
+            start = time.perf_counter()
+            _full_app = importlib.import_module('api.index')
+            callback_metrics.record_startup('full_app', time.perf_counter() - start)
+        return _full_app
+
+
+def full_app_bundle():
+    """A bundle without responses, so that the full app renders every analysis."""
+    from growth.serving import analysis_dropdown
+
+    module = full_app()
+    dropdown = analysis_dropdown(module.app.layout)
+    return {'analyses': [{'label': option['label'], 'value': option['value']} for option in dropdown.options],
+            'default': dropdown.value, 'filters': filter_options(module.dataset.frame), 'responses': {}}
+
+
+_step = time.perf_counter()
+try:
+    bundle = load_bundle(os.path.join(HERE, BUNDLE_NAME), os.path.join(HERE, 'index.py'),
+                         os.path.join(HERE, DATA_FILE))
+except (OSError, ValueError) as error:
+    print(f"Not using the response bundle ({error}); rebuild it with "
+          f"`python -m growth.bundle api/index.py`", file=sys.stderr)
+    bundle = full_app_bundle()
+callback_metrics.record_startup('bundle', time.perf_counter() - _step)
+
+# Initialize the Dash app
+_step = time.perf_counter()
+app = dash.Dash(__name__)
+enable_layout_etags(app)
+
+# WSGI entry point
+server = app.server
+
+register_metrics_routes(app.server, callback_metrics)
+
+# Same layout as api/index.py, from the bundle's analysis list and filter options
+app.layout = html.Div([
+    html.H1("WPPOOL Growth Analytics Dashboard", style={'textAlign': 'center', 'color': '#2c3e50'}),
+
+    # Dropdown for selecting analysis
+    dcc.Dropdown(
+        id='analysis-dropdown',
+        options=bundle['analyses'],
+        value=bundle['default'],
+        style={'width': '50%', 'margin': 'auto', 'marginBottom': '20px'}
+    ),
+
+    # Cross-filters applied to every analysis
+    filter_controls(bundle['filters']),
+
+    # Graph container
+    html.Div(id='graph-container', style={'marginTop': '20px'})
+])
+
+@app.callback(
+    Output('graph-container', 'children'),
+    [Input('analysis-dropdown', 'value'),
+     Input('country-filter', 'value'), Input('plan-filter', 'value'), Input('subscription-filter', 'value'),
+     Input('install-date-filter', 'start_date'), Input('install-date-filter', 'end_date')]
+)
+def update_graph(selected_analysis, countries=None, plans=None, subscriptions=None, start_date=None, end_date=None):
+    start = time.perf_counter()
+    filtered = any([countries, plans, subscriptions, start_date, end_date])
+    response = None if filtered else bundle['responses'].get(selected_analysis)
+    if response is not None:
+        callback_metrics.observe(selected_analysis, time.perf_counter() - start, cache_hit=True)
+        return response
+    response = full_app().update_graph(selected_analysis, countries, plans, subscriptions, start_date, end_date)
+    callback_metrics.observe(selected_analysis, time.perf_counter() - start, cache_hit=False)
+    return response
+
+
+callback_metrics.record_startup('app', time.perf_counter() - _step)
+callback_metrics.record_startup('total', time.perf_counter() - _started)
+print('Cold start: ' + ', '.join(f"{step} {seconds * 1000:.0f} ms"
+                                  for step, seconds in callback_metrics.startup.items()), file=sys.stderr)
+
+if __name__ == '__main__':
+    app.run(debug=False)
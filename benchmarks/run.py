@@ -0,0 +1,228 @@
+# Scaling benchmarks for the dashboards
+#
+# Generates synthetic exports at each size, then, in a fresh process per
+# (app, size), times loading, cleaning, app startup, every update_graph
+# analysis and a few cross-filter queries, recording wall time, peak RSS and the
+# serialized response size. peak_rss_mb is the child process's high-water mark
+# when the step finished, so it covers that step and every step before it; it
+# only ever grows and is not the memory of a single step (None on Windows). Each app's cold start (a fresh interpreter importing
+# it) is timed as well; the serverless entry point, which answers from its
+# prebuilt bundle rather than the CSV, is only timed for that.
+#
+#   python -m benchmarks.run --sizes 20000 200000 2000000 10000000
+#   python -m benchmarks.run --compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from growth.serving import analysis_values
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'benchmarks', '.data')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+DEFAULT_SIZES = [20000, 200000, 1000000]
+DEFAULT_APPS = ['index.py', 'api/index.py', 'api/serverless.py']
+# Apps without a dataset of their own, of which only the cold start is measured
+COLD_START_ONLY = {'api/serverless.py'}
+# The apps read this file name from their working directory
+CSV_NAME = 'wppool_growth_data_sample_20k.csv'
+REGRESSION_RATIO = 1.2
+# Cross-filter combinations timed against the app's live dataset
+FILTER_CASES = {
+    'country': {'country': ['USA', 'UK']},
+    'plan+dates': {'plan_type': ['Basic'], 'install_date': ['2023-03-01', '2023-06-30']},
+    'dates': {'install_date': ['2023-02-01', None]},
+}
+
+
+def peak_rss_mb():
+    """Peak RSS of this process so far, in MB (None where the resource module is missing)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def dataset_dir(size, seed=0):
+    from benchmarks.synthetic import write_csv
+
+    directory = os.path.join(DATA_DIR, f"{size}-{seed}")
+    path = os.path.join(directory, CSV_NAME)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        write_csv(size, path + '.tmp', seed)
+        os.replace(path + '.tmp', path)
+    return directory
+
+
+def _best_of(repeat, func):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def measure(app_path, csv_dir, repeat):
+    """Run inside a child process: time every stage of one app on one dataset."""
+    sys.path.insert(0, ROOT)
+    os.chdir(csv_dir)
+    from growth.cleaning import clean_growth_data
+    from growth.figure_cache import to_payload
+    from growth.loader import load_growth_data
+
+    records = []
+
+    def record(step, wall_s, response_bytes=None):
+        peak = peak_rss_mb()
+        records.append({'step': step, 'wall_s': round(wall_s, 6),
+                        'peak_rss_mb': None if peak is None else round(peak, 1), 'response_bytes': response_bytes})
+
+    shutil.rmtree(os.environ['WPPOOL_CACHE_DIR'], ignore_errors=True)
+    start = time.perf_counter()
+    load_growth_data(CSV_NAME)
+    record('load_cold', time.perf_counter() - start)
+    df, wall = _best_of(repeat, lambda: load_growth_data(CSV_NAME))
+    record('load_warm', wall)
+    _, wall = _best_of(repeat, lambda: clean_growth_data(df)[0].describe(include='all'))
+    record('clean', wall)
+    del df
+
+    start = time.perf_counter()
+    spec = importlib.util.spec_from_file_location('benchmarked_app', os.path.join(ROOT, app_path))
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    record('startup', time.perf_counter() - start)
+
+    compute = getattr(app.update_graph, '__wrapped__', app.update_graph)
+    for value in analysis_values(app.app.layout):
+        payload, wall = _best_of(repeat, lambda: to_payload(compute(value)))
+        record(f"analysis:{value}", wall, len(json.dumps(payload, separators=(',', ':'))))
+        app.update_graph(value)
+        _, wall = _best_of(repeat, lambda: app.update_graph(value))
+        record(f"analysis:{value}:cached", wall)
+
+    from growth.filters import FilterIndex
+
+    frame = app.dataset.frame
+    index, wall = _best_of(1, lambda: FilterIndex(frame))
+    record('filter_index', wall)
+    for name, filters in FILTER_CASES.items():
+        _, wall = _best_of(repeat, lambda: index.view(frame, filters, app.dataset.cube))
+        record(f"filter:{name}", wall)
+    return records
+
+
+def cold_start(app_path, csv_dir, env, repeat):
+    """Best wall time of a fresh interpreter importing the app, as a serverless host would."""
+    code = f"import runpy, sys; sys.path.insert(0, {ROOT!r}); runpy.run_path({os.path.join(ROOT, app_path)!r})"
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=csv_dir, env=env, check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return {'step': 'cold_start', 'wall_s': round(min(timings), 6), 'peak_rss_mb': None, 'response_bytes': None}
+
+
+def run(sizes, apps, repeat, seed):
+    results = []
+    for size in sizes:
+        csv_dir = dataset_dir(size, seed)
+        for app_path in apps:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                env = dict(os.environ, WPPOOL_CACHE_DIR=cache_dir)
+                env.pop('WPPOOL_FIGURE_CACHE_DIR', None)
+                # The apps read the benchmark CSV from their working directory
+                env.pop('WPPOOL_DATA_DIR', None)
+                try:
+                    records = [cold_start(app_path, csv_dir, env, repeat)]
+                except subprocess.CalledProcessError as error:
+                    print(f"{app_path} @ {size:,} rows failed to start:\n{error.stderr.decode()}", file=sys.stderr)
+                    continue
+                if app_path not in COLD_START_ONLY:
+                    child = subprocess.run(
+                        [sys.executable, '-m', 'benchmarks.run', '--child', app_path, csv_dir, '--repeat', str(repeat)],
+                        cwd=ROOT, env=env, capture_output=True, text=True)
+                    if child.returncode != 0:
+                        print(f"{app_path} @ {size:,} rows failed:\n{child.stderr}", file=sys.stderr)
+                        continue
+                    records += json.loads(child.stdout.strip().splitlines()[-1])
+            for record in records:
+                results.append(dict(record, app=app_path, rows=size))
+                rss = '' if record['peak_rss_mb'] is None else f"{record['peak_rss_mb']:.1f} MB"
+                print(f"{app_path:14} {size:>10,} {record['step']:32} {record['wall_s']:>10.4f}s "
+                      f"{rss:>11} {record['response_bytes'] or '':>10}")
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    import pandas as pd
+
+    return {'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'commit': commit or None,
+            'python': platform.python_version(), 'pandas': pd.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = {(r['app'], r['rows'], r['step']): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {(r['app'], r['rows'], r['step']): r for r in json.load(f)['results']}
+    regressions = 0
+    for key in sorted(set(old) & set(new)):
+        before, after = old[key]['wall_s'], new[key]['wall_s']
+        ratio = after / before if before else float('inf')
+        flag = 'REGRESSION' if ratio > REGRESSION_RATIO else ''
+        regressions += bool(flag)
+        print(f"{key[0]:14} {key[1]:>10,} {key[2]:32} {before:>10.4f}s -> {after:>10.4f}s  x{ratio:5.2f} {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboards on synthetic growth data.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--apps', nargs='+', default=DEFAULT_APPS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'))
+    parser.add_argument('--child', nargs=2, metavar=('APP', 'CSV_DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child[0], args.child[1], args.repeat)))
+        return
+    if args.compare:
+        sys.exit(1 if compare(*args.compare) else 0)
+
+    results = run(args.sizes, args.apps, args.repeat, args.seed)
+    meta = metadata()
+    output = args.output or os.path.join(RESULTS_DIR, meta['timestamp'].replace(':', '') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Synthetic growth data matching the schema and distributions of
+# wppool_growth_data_sample_20k.csv, at any size
+#
+#   python -m benchmarks.synthetic 1000000 -o growth_1m.csv
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Distributions measured on the 20k sample
+COUNTRIES = ['Australia', 'Canada', 'France', 'Germany', 'India', 'UK', 'USA']
+PLANS = ['Basic', 'Enterprise', 'Standard']
+PLAN_PRICES = [29, 49, 99]
+PRO_SHARE = 0.2015
+CHURN_RATE = 0.285
+DOWNLOAD_CLICK_RATE = 0.102
+ACTIVATION_RATE = 0.9906
+FIRST_INSTALL = pd.Timestamp('2023-01-01')
+LAST_DAY = pd.Timestamp('2024-01-01')
+CHURNED_MAX_DAYS = 25
+HEAVY_USER_SHARE = 0.1
+DATE_FORMAT = '%m/%d/%Y'
+
+
+def generate(n_rows, seed=0):
+    """Return a raw (string-dated) growth table with `n_rows` users."""
+    rng = np.random.default_rng(seed)
+    span = (LAST_DAY - FIRST_INSTALL).days
+
+    install_offset = rng.integers(0, span + 1, n_rows)
+    remaining = span - install_offset
+    churned = rng.random(n_rows) < CHURN_RATE
+    # Churned users leave within a few weeks; the rest stay active for at least
+    # a month, skewed towards the end of the observation window
+    first_month = np.minimum(31, remaining)
+    days_active = np.where(
+        churned,
+        np.minimum(rng.integers(0, CHURNED_MAX_DAYS + 1, n_rows), remaining),
+        first_month + (np.sqrt(rng.random(n_rows)) * (remaining - first_month)).round().astype(int),
+    )
+
+    heavy = rng.random(n_rows) < HEAVY_USER_SHARE
+    total_sessions = np.where(heavy, rng.integers(151, 301, n_rows), rng.integers(1, 151, n_rows))
+    page_views = total_sessions * rng.integers(1, 6, n_rows)
+
+    pro = rng.random(n_rows) < PRO_SHARE
+    plan_type = np.where(pro, np.array(PLANS, dtype=object)[rng.integers(0, len(PLANS), n_rows)], None)
+    monthly_revenue = np.where(pro, np.array(PLAN_PRICES)[rng.integers(0, len(PLAN_PRICES), n_rows)], 0)
+
+    install_date = FIRST_INSTALL + pd.to_timedelta(install_offset, unit='D')
+    last_active_date = install_date + pd.to_timedelta(days_active, unit='D')
+    # In the export a Pro user's upgrade date is their last active date
+    pro_upgrade_date = pd.Series(last_active_date).where(pro)
+
+    return pd.DataFrame({
+        'user_id': np.arange(1, n_rows + 1),
+        'install_date': install_date.strftime(DATE_FORMAT),
+        'last_active_date': last_active_date.strftime(DATE_FORMAT),
+        'subscription_type': np.where(pro, 'Pro', 'Free'),
+        'country': np.array(COUNTRIES, dtype=object)[rng.integers(0, len(COUNTRIES), n_rows)],
+        'total_sessions': total_sessions,
+        'page_views': page_views,
+        'download_clicks': (rng.random(n_rows) < DOWNLOAD_CLICK_RATE).astype(int),
+        'activation_status': (rng.random(n_rows) < ACTIVATION_RATE).astype(int),
+        'days_active': days_active,
+        'pro_upgrade_date': pro_upgrade_date.dt.strftime(DATE_FORMAT),
+        'plan_type': plan_type,
+        'monthly_revenue': monthly_revenue,
+        'churned': churned.astype(int),
+    })
+
+
+def write_csv(n_rows, path, seed=0, chunk_rows=1000000):
+    """Write a synthetic export to `path` in chunks so large sizes fit in memory."""
+    for start in range(0, n_rows, chunk_rows):
+        chunk = generate(min(chunk_rows, n_rows - start), seed=seed + start)
+        chunk['user_id'] += start
+        chunk.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic growth export.')
+    parser.add_argument('rows', type=int)
+    parser.add_argument('-o', '--output', default='wppool_growth_data_synthetic.csv')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_csv(args.rows, args.output, args.seed)
+    print(f"Wrote {args.rows:,} rows to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
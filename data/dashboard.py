@@ -1,30 +1,55 @@
-import subprocess
+import os
 import sys
 
-# List of required libraries
-required_libs = ["pandas", "dash", "plotly"]
-
-# Install missing libraries
-for lib in required_libs:
-    try:
-        __import__(lib)
-    except ImportError:
-        print(f"Installing missing library: {lib}")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", lib])
-
 import pandas as pd
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
 
+# Make the shared `growth` package importable when run from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from growth.controls import FILTER_CHOICE_PROPS, filter_choices, filter_controls
+from growth.engagement import engagement_figure
+from growth.figure_cache import cached_analysis, default_cache, enable_layout_etags
+from growth.filters import make_filters
+from growth.jobs import POLL_INTERVAL_MS, JobRunner, background_analyses
+from growth.live import LiveDataset, register_ingest_route
+from growth.loader import data_path, load_growth_data
+from growth.metrics import CallbackMetrics, phase, register_metrics_routes
 
 # Load the dataset
-df = pd.read_csv('wppool_growth_data_sample_20k.csv')
+df = load_growth_data(data_path('wppool_growth_data_sample_20k.csv'))
+
+# Live dataset: accepts upserts keyed on user_id and keeps the aggregate cube
+# shared by every analysis below current. Under gunicorn, workers share ingested
+# rows through a journal in WPPOOL_INGEST_JOURNAL_DIR
+dataset = LiveDataset(df, journal_dir=os.environ.get('WPPOOL_INGEST_JOURNAL_DIR'))
+
+REFRESH_INTERVAL_MS = int(os.environ.get('WPPOOL_REFRESH_INTERVAL_MS', 30000))
 
 # Initialize the Dash app
 app = dash.Dash(__name__)
+enable_layout_etags(app)
+
+# WSGI entry point for gunicorn (see gunicorn.conf.py)
+server = app.server
+
+# Rendered responses keyed on (analysis, filters, dataset version)
+figure_cache = default_cache()
+
+# Per-analysis latency, cache and payload metrics for Prometheus at /metrics
+callback_metrics = CallbackMetrics()
+register_metrics_routes(app.server, callback_metrics)
+
+# Analyses slow enough to render in the background job pool (see growth.jobs)
+BACKGROUND_ANALYSES = {'engagement', 'market'}
+job_runner = JobRunner()
+
+# POST new or changed user rows to /api/users to update the dashboard without a reload
+# (only served when WPPOOL_INGEST_TOKEN is set)
+register_ingest_route(app.server, dataset, token=os.environ.get('WPPOOL_INGEST_TOKEN'))
 
 # Define the layout of the dashboard
 app.layout = html.Div([
@@ -44,76 +69,123 @@ app.layout = html.Div([
         value='churn',  # Default selection
         style={'width': '50%', 'margin': 'auto', 'marginBottom': '20px'}
     ),
+
+    # Cross-filters applied to every analysis
+    filter_controls(dataset.frame),
     
     # Graph container
-    html.Div(id='graph-container', style={'marginTop': '20px'})
+    html.Div(id='graph-container', style={'marginTop': '20px'}),
+
+    # Polls for ingested data so open dashboards refresh themselves
+    dcc.Store(id='data-version'),
+    dcc.Interval(id='refresh-interval', interval=REFRESH_INTERVAL_MS),
+
+    # Polls the progress of a background analysis while one is pending
+    dcc.Interval(id='job-poll', interval=POLL_INTERVAL_MS, disabled=True)
 ])
 
-# Callback to update the graph based on dropdown selection
+# Publish the dataset version to the browser only when ingested rows changed it
+@app.callback(
+    Output('data-version', 'data'),
+    [Input('refresh-interval', 'n_intervals')],
+    [State('data-version', 'data')]
+)
+def poll_data_version(n_intervals, known_version):
+    return dash.no_update if known_version == dataset.version else dataset.version
+
+# Rebuild the filter choices when ingested rows add a country, plan or install date
 @app.callback(
-    Output('graph-container', 'children'),
-    [Input('analysis-dropdown', 'value')]
+    [Output(component, prop) for component, prop in FILTER_CHOICE_PROPS],
+    [Input('data-version', 'data')],
+    prevent_initial_call=True
 )
-def update_graph(selected_analysis):
+def refresh_filter_choices(data_version):
+    return filter_choices(dataset.frame)
+
+# Render an analysis (the dashboard callback below runs the heavy ones as background jobs)
+# data_version only triggers a re-render; the dataset version is already in the key
+@cached_analysis(figure_cache, 'dashboard', lambda: dataset.version, callback_metrics, ignore=('data_version',))
+def update_graph(selected_analysis, countries=None, plans=None, subscriptions=None,
+                 start_date=None, end_date=None, data_version=None):
+    view = dataset.view(make_filters(countries, plans, subscriptions, start_date, end_date))
+    if view.n_rows == 0:
+        return html.P("No users match the selected filters.", style={'textAlign': 'center'})
+    cube = view.cube
     if selected_analysis == 'churn':
         # Churn Rate by Subscription Type (Pie Chart)
-        churn_data = df.groupby('subscription_type')['churned'].mean() * 100
-        fig = px.pie(churn_data, values=churn_data.values, names=churn_data.index, 
-                      title='Churn Rate by Subscription Type', hole=0.4,
-                      color_discrete_sequence=px.colors.qualitative.Pastel)
-        fig.update_traces(textposition='inside', textinfo='percent+label')
+        churn_data = cube.share('subscription_type', where={'churned': 1}) * 100
+        with phase('figure'):
+            fig = px.pie(churn_data, values=churn_data.values, names=churn_data.index, 
+                          title='Churn Rate by Subscription Type', hole=0.4,
+                          color_discrete_sequence=px.colors.qualitative.Pastel)
+            fig.update_traces(textposition='inside', textinfo='percent+label')
         return dcc.Graph(figure=fig, config={'toImageButtonOptions': {'format': 'png', 'filename': 'churn_rate'}})
     
     elif selected_analysis == 'conversion':
         # Conversion Rate by Country (Stacked Bar Chart)
-        top_countries = df['country'].value_counts().nlargest(5).index
-        conversion_data = df[df['country'].isin(top_countries)].groupby(['country', 'subscription_type']).size().unstack()
-        fig = px.bar(conversion_data, barmode='stack', 
-                      labels={'value': 'Number of Users', 'country': 'Country'},
-                      title='Conversion Rate by Country (Top 5 Countries)',
-                      color_discrete_sequence=px.colors.qualitative.Pastel)
+        users_by_country = cube.rollup(['country', 'subscription_type'], stat='count').unstack()
+        top_countries = users_by_country.sum(axis=1).nlargest(5).index
+        conversion_data = users_by_country.loc[top_countries].sort_index()
+        with phase('figure'):
+            fig = px.bar(conversion_data, barmode='stack', 
+                          labels={'value': 'Number of Users', 'country': 'Country'},
+                          title='Conversion Rate by Country (Top 5 Countries)',
+                          color_discrete_sequence=px.colors.qualitative.Pastel)
         return dcc.Graph(figure=fig, config={'toImageButtonOptions': {'format': 'png', 'filename': 'conversion_rate'}})
     
     elif selected_analysis == 'revenue':
         # Monthly Revenue by Plan Type (Pie Chart)
-        revenue_data = df[df['subscription_type'] == 'Pro'].groupby('plan_type')['monthly_revenue'].sum()
-        fig = px.pie(revenue_data, values=revenue_data.values, names=revenue_data.index, 
-                      title='Monthly Revenue by Plan Type', hole=0.4,
-                      color_discrete_sequence=px.colors.qualitative.Pastel)
-        fig.update_traces(textposition='inside', textinfo='percent+label')
+        revenue_data = cube.rollup('plan_type', 'monthly_revenue', where={'subscription_type': 'Pro'})
+        with phase('figure'):
+            fig = px.pie(revenue_data, values=revenue_data.values, names=revenue_data.index, 
+                          title='Monthly Revenue by Plan Type', hole=0.4,
+                          color_discrete_sequence=px.colors.qualitative.Pastel)
+            fig.update_traces(textposition='inside', textinfo='percent+label')
         return dcc.Graph(figure=fig, config={'toImageButtonOptions': {'format': 'png', 'filename': 'revenue_distribution'}})
     
     elif selected_analysis == 'engagement':
-        # User Engagement by Subscription Type (Scatter Plot)
-        fig = px.scatter(df, x='total_sessions', y='days_active', color='subscription_type',
-                          labels={'total_sessions': 'Total Sessions', 'days_active': 'Days Active'},
-                          title='User Engagement by Subscription Type',
-                          color_discrete_sequence=px.colors.qualitative.Pastel)
+        # User Engagement by Subscription Type (WebGL scatter, sampled or binned for large tables)
+        with phase('figure'):
+            fig = engagement_figure(view.frame)
         return dcc.Graph(figure=fig, config={'toImageButtonOptions': {'format': 'png', 'filename': 'user_engagement'}})
     
     elif selected_analysis == 'market':
         # Market Expansion Opportunities: Total Revenue by Country (Choropleth Map)
-        revenue_by_country = df.groupby('country')['monthly_revenue'].sum().reset_index()
-        fig = px.choropleth(revenue_by_country, locations='country', locationmode='country names',
-                             color='monthly_revenue', hover_name='country',
-                             title='Total Revenue by Country',
-                             color_continuous_scale=px.colors.sequential.Plasma)
+        revenue_by_country = cube.rollup('country', 'monthly_revenue').reset_index()
+        with phase('figure'):
+            fig = px.choropleth(revenue_by_country, locations='country', locationmode='country names',
+                                 color='monthly_revenue', hover_name='country',
+                                 title='Total Revenue by Country',
+                                 color_continuous_scale=px.colors.sequential.Plasma)
         return dcc.Graph(figure=fig, config={'toImageButtonOptions': {'format': 'png', 'filename': 'market_expansion'}})
     
     elif selected_analysis == 'comparison':
         # High-Engagement vs. Underpenetrated Markets (Grouped Bar Chart)
-        high_engagement = df.groupby('country')['total_sessions'].sum().nlargest(5).reset_index()
-        underpenetrated = df.groupby('country')['total_sessions'].sum().nsmallest(5).reset_index()
+        sessions_by_country = cube.rollup('country', 'total_sessions')
+        high_engagement = sessions_by_country.nlargest(5).reset_index()
+        underpenetrated = sessions_by_country.nsmallest(5).reset_index()
         high_engagement['market_type'] = 'High Engagement'
         underpenetrated['market_type'] = 'Underpenetrated'
         combined_data = pd.concat([high_engagement, underpenetrated])
         
-        fig = px.bar(combined_data, x='country', y='total_sessions', color='market_type',
-                      labels={'x': 'Country', 'y': 'Total Sessions'},
-                      title='High-Engagement vs. Underpenetrated Markets',
-                      color_discrete_sequence=px.colors.qualitative.Pastel)
+        with phase('figure'):
+            fig = px.bar(combined_data, x='country', y='total_sessions', color='market_type',
+                          labels={'x': 'Country', 'y': 'Total Sessions'},
+                          title='High-Engagement vs. Underpenetrated Markets',
+                          color_discrete_sequence=px.colors.qualitative.Pastel)
         return dcc.Graph(figure=fig, config={'toImageButtonOptions': {'format': 'png', 'filename': 'market_comparison'}})
 
+# Callback to update the graph based on dropdown selection. Heavy analyses are
+# rendered by the job pool, identical requests share one job, and the page polls
+# for progress and partial results until the response is ready
+app.callback(
+    [Output('graph-container', 'children'), Output('job-poll', 'disabled')],
+    [Input('analysis-dropdown', 'value'),
+     Input('country-filter', 'value'), Input('plan-filter', 'value'), Input('subscription-filter', 'value'),
+     Input('install-date-filter', 'start_date'), Input('install-date-filter', 'end_date'),
+     Input('data-version', 'data'), Input('job-poll', 'n_intervals')]
+)(background_analyses(job_runner, update_graph, BACKGROUND_ANALYSES))
+
 # Run the app
 if __name__ == '__main__':
     app.run_server(debug=True)
\ No newline at end of file
@@ -0,0 +1 @@
+# Shared analytics helpers for the WPPOOL growth dashboards
@@ -0,0 +1,180 @@
+# Aggregate cube shared by every dashboard analysis
+#
+# The cube is built once per dataset version and holds, for every
+# (country, subscription_type, plan_type, churned) cell, the row count plus the
+# sum, sum of squares and mean of each numeric measure. Dashboard callbacks roll
+# the cube up instead of re-running groupbys over the full user table.
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+KEYS = ['country', 'subscription_type', 'plan_type', 'churned']
+MEASURES = ['total_sessions', 'page_views', 'download_clicks',
+            'activation_status', 'days_active', 'monthly_revenue']
+TOP_N = 5
+TOP_USER_COLUMNS = ['user_id', 'total_sessions', 'subscription_type']
+
+# Keep the last few versions around so a reload does not evict the live cube
+# while callbacks are still reading it
+_MAX_CACHED_CUBES = 4
+_cubes = {}
+
+
+def dataset_version(df):
+    """Return a short content hash identifying this version of the dataset."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()[:16]
+
+
+class AggregateCube:
+    def __init__(self, table, n_rows, top_users, version=None):
+        self.table = table
+        self.n_rows = n_rows
+        self.top_users = top_users
+        self.version = version
+        self._drivers = None
+
+    @classmethod
+    def from_frame(cls, df, version=None):
+        group_ids, index = cell_codes(df)
+        return cls.from_cells(df, group_ids, index, version=version)
+
+    @classmethod
+    def from_cells(cls, df, group_ids, index, rows=None, version=None):
+        """Build the cube from per-row cell codes (see `cell_codes`).
+
+        `rows` restricts the cube to those row positions of `df`, which is how
+        filtered views are summarized without regrouping the table.
+        """
+        if rows is not None:
+            group_ids = group_ids[rows]
+        table = _accumulate(group_ids, len(index), df, rows)
+        table.index = index
+        table = table[table[('count', '')] > 0]
+        return cls(table, len(group_ids), top_users(df, rows), version)
+
+    def _select(self, where):
+        table = self.table
+        for key, value in (where or {}).items():
+            table = table[table.index.get_level_values(key) == value]
+        return table
+
+    def rollup(self, by=None, measure=None, stat='sum', where=None):
+        """Roll the cube up to `by` (a key or list of keys, None for a grand total).
+
+        `stat` is 'count', 'sum' or 'mean' of `measure`; `where` restricts the
+        cube to cells matching {key: value} before rolling up.
+        """
+        table = self._select(where)
+        columns = [('count', '')] if measure is None else [('count', ''), (measure, 'sum')]
+        if by is None:
+            totals = table[columns].sum()
+        else:
+            totals = table[columns].groupby(level=by, dropna=False, observed=True, sort=True).sum()
+        count = totals[('count', '')]
+        if stat == 'count':
+            return count if by is None else count.rename('count')
+        total = totals[(measure, 'sum')]
+        if stat == 'sum':
+            return total if by is None else total.rename(measure)
+        if stat == 'mean':
+            if by is None:
+                return total / count if count else np.nan
+            return (total / count).rename(measure)
+        raise ValueError(f"Unknown statistic: {stat}")
+
+    def share(self, by, where):
+        """Fraction of rows in each `by` group that also match `where`."""
+        matching = self.rollup(by, stat='count', where=where)
+        return (matching / self.rollup(by, stat='count')).fillna(0)
+
+    def merge(self, other):
+        """Combine with a cube built from a disjoint set of rows (e.g. another chunk)."""
+        top_users = pd.concat([self.top_users, other.top_users]).nlargest(TOP_N, 'total_sessions')
+        return self._combine(other, 1, top_users)
+
+    def subtract(self, other):
+        """Remove the contribution of rows summarized by `other` (e.g. rows being replaced).
+
+        Top users cannot be un-merged, so callers that remove rows must refresh
+        `top_users` themselves when one of the removed rows was among them.
+        """
+        return self._combine(other, -1, self.top_users)
+
+    def _combine(self, other, sign, top_users):
+        additive = [column for column in self.table.columns if column[1] != 'mean']
+        table = (pd.concat([self.table[additive], other.table[additive] * sign])
+                 .groupby(level=KEYS, dropna=False, sort=True).sum())
+        table = table[table[('count', '')] > 0]
+        for measure in MEASURES:
+            table[(measure, 'mean')] = table[(measure, 'sum')] / table[('count', '')]
+        cube = AggregateCube(table[self.table.columns], self.n_rows + sign * other.n_rows, top_users)
+        if self._drivers is not None:
+            # Carry the churn drivers forward from the other rows alone
+            cube._drivers = self._drivers._combine(other.churn_drivers(), sign)
+        return cube
+
+    def churn_drivers(self):
+        """The ChurnDrivers of the rows in this cube (see growth.churn), computed once."""
+        if self._drivers is None:
+            from growth.churn import ChurnDrivers
+
+            self._drivers = ChurnDrivers.from_cube(self)
+        return self._drivers
+
+
+def cell_codes(df):
+    """Return each row's cube cell number and the cells' (KEYS) index."""
+    grouped = df.groupby(KEYS, dropna=False, observed=True, sort=True)
+    return grouped.ngroup().to_numpy(), grouped.size().index
+
+
+def _column(df, column, rows=None):
+    if rows is not None:
+        # Gather the selected rows before converting, not the whole column
+        values = df[column].to_numpy()
+        if values.dtype.kind in 'biuf':
+            return values[rows].astype('float64')
+    values = df[column].to_numpy(dtype='float64', na_value=np.nan)
+    return values if rows is None else values[rows]
+
+
+def top_users(df, rows=None):
+    """The TOP_N users by total sessions, among `rows` (positions) when given."""
+    if rows is None:
+        return df.nlargest(TOP_N, 'total_sessions')[TOP_USER_COLUMNS]
+    # Same result as nlargest (first rows win ties) without copying the selection
+    sessions = _column(df, 'total_sessions', rows)
+    if len(rows) > TOP_N:
+        threshold = np.partition(np.nan_to_num(sessions, nan=-np.inf), len(rows) - TOP_N)[len(rows) - TOP_N]
+        candidates = np.flatnonzero(sessions >= threshold)
+    else:
+        candidates = np.flatnonzero(~np.isnan(sessions))
+    top = candidates[np.argsort(-sessions[candidates], kind='stable')[:TOP_N]]
+    return df[TOP_USER_COLUMNS].iloc[rows[top]]
+
+
+def _accumulate(group_ids, n_groups, df, rows=None):
+    columns = {('count', ''): np.bincount(group_ids, minlength=n_groups)}
+    for measure in MEASURES:
+        values = _column(df, measure, rows)
+        values = np.where(np.isnan(values), 0.0, values)
+        total = np.bincount(group_ids, weights=values, minlength=n_groups)
+        columns[(measure, 'sum')] = total
+        columns[(measure, 'sumsq')] = np.bincount(group_ids, weights=values * values, minlength=n_groups)
+        columns[(measure, 'mean')] = total / np.maximum(columns[('count', '')], 1)
+    return pd.DataFrame(columns)
+
+
+def get_cube(df, version=None):
+    """Return the aggregate cube for `df`, building it once per dataset version."""
+    if version is None:
+        version = dataset_version(df)
+    cube = _cubes.get(version)
+    if cube is None:
+        cube = AggregateCube.from_frame(df, version)
+        _cubes[version] = cube
+        while len(_cubes) > _MAX_CACHED_CUBES:
+            _cubes.pop(next(iter(_cubes)))
+    return cube
@@ -0,0 +1,193 @@
+# Prebuilt responses for the serverless dashboard
+#
+#   python -m growth.bundle api/index.py
+#
+# At deploy time the full app is imported once and every analysis is rendered
+# for the unfiltered data. The responses are stored as the component JSON Dash
+# sends to the browser, along with the analysis list and the filter options, in
+# one gzip-compressed file next to the app. api/serverless.py answers from that
+# file without reading the CSV or importing pandas, numpy or plotly.express.
+#
+# The bundle records SHA-256 digests of the CSV and of the code that rendered
+# it: the app and the growth modules it imports, directly or through other
+# growth modules. `load_bundle` rejects a bundle whose digests no longer match,
+# so a stale bundle is never served, and `--check` fails on one before deploy.
+import argparse
+import ast
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import sys
+import time
+
+BUNDLE_NAME = 'bundle.json.gz'
+# The CSV the apps read from their working directory
+DATA_FILE = 'wppool_growth_data_sample_20k.csv'
+# Bumped when the layout of the bundle changes, so old bundles are rebuilt
+BUNDLE_FORMAT = 3
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _digest(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode() + b'\0')
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def data_fingerprint(data_path):
+    return _digest([data_path])
+
+
+def _growth_imports(path):
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), path)
+    names = set()
+    # Function-level imports count too: the analyses import some modules lazily
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split('.')[1] for alias in node.names if alias.name.startswith('growth.'))
+        elif isinstance(node, ast.ImportFrom) and node.module == 'growth':
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and (node.module or '').startswith('growth.'):
+            names.add(node.module.split('.')[1])
+    return {f"{name}.py" for name in names if os.path.exists(os.path.join(PACKAGE_DIR, f"{name}.py"))}
+
+
+def app_modules(app_path):
+    """File names of the growth modules `app_path` imports, directly or through each other."""
+    modules = {'__init__.py'} if os.path.exists(os.path.join(PACKAGE_DIR, '__init__.py')) else set()
+    pending = _growth_imports(app_path)
+    while pending:
+        name = pending.pop()
+        if name not in modules:
+            modules.add(name)
+            pending |= _growth_imports(os.path.join(PACKAGE_DIR, name))
+    return sorted(modules)
+
+
+def code_fingerprint(app_path, modules):
+    """Digest of the app's source and of the growth modules named in `modules`."""
+    return _digest([app_path] + [os.path.join(PACKAGE_DIR, name) for name in modules])
+
+
+def load_bundle(path, app_path=None, data_path=None):
+    """Read a bundle, checking it was built from `app_path` and `data_path` when given.
+
+    Raises ValueError for a bundle of another format or a stale one.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        bundle = json.load(f)
+    if bundle.get('format') != BUNDLE_FORMAT:
+        raise ValueError(f"{path} has bundle format {bundle.get('format')}, expected {BUNDLE_FORMAT}")
+    if data_path is not None and bundle['data'] != data_fingerprint(data_path):
+        raise ValueError(f"{path} was built from other data than {data_path}")
+    if app_path is not None and bundle['code'] != code_fingerprint(app_path, bundle['modules']):
+        raise ValueError(f"{path} was built from other code than {app_path} and the growth modules it imports")
+    return bundle
+
+
+def check_bundle(app_path, path=None, data_dir=None):
+    """Raise ValueError unless the bundle at `path` matches the app's current data and code.
+
+    Unlike `load_bundle`, the app's imports are traced again, so a module it
+    started importing since the build is noticed too.
+    """
+    from growth.loader import DATA_DIR_ENV
+
+    path = path or os.path.join(os.path.dirname(os.path.abspath(app_path)), BUNDLE_NAME)
+    # Resolved like the build, where the app reads DATA_FILE through growth.loader.data_path
+    data_dir = os.environ.get(DATA_DIR_ENV) or data_dir or os.path.dirname(os.path.abspath(app_path))
+    bundle = load_bundle(path, app_path, os.path.join(data_dir, DATA_FILE))
+    if bundle['modules'] != app_modules(app_path):
+        raise ValueError(f"{path} was built before {app_path} changed which growth modules it imports")
+    return bundle
+
+
+def build_bundle(app_path, output=None, data_dir=None):
+    """Render every analysis of the app at `app_path` into a bundle; returns seconds per step.
+
+    The app is imported with `data_dir` (default: the app's directory) as the
+    working directory, where it reads DATA_FILE. The bundle is only rewritten
+    when its content changed.
+    """
+    from growth.controls import filter_options
+    from growth.figure_cache import to_payload
+    from growth.loader import data_path
+    from growth.serving import analysis_dropdown
+
+    app_path = os.path.abspath(app_path)
+    output = output or os.path.join(os.path.dirname(app_path), BUNDLE_NAME)
+    timings = {}
+    cwd = os.getcwd()
+    os.chdir(data_dir or os.path.dirname(app_path))
+    try:
+        start = time.perf_counter()
+        spec = importlib.util.spec_from_file_location('bundled_app', app_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        timings['startup'] = time.perf_counter() - start
+
+        modules = app_modules(app_path)
+        dropdown = analysis_dropdown(module.app.layout)
+        responses = {}
+        for option in dropdown.options:
+            start = time.perf_counter()
+            response = module.update_graph(option['value'])
+            # Apps with a figure cache already return the serialized payload
+            responses[option['value']] = response if isinstance(response, dict) else to_payload(response)
+            timings[f"analysis:{option['value']}"] = time.perf_counter() - start
+        bundle = {'format': BUNDLE_FORMAT, 'version': module.dataset.version,
+                  'data': data_fingerprint(data_path(DATA_FILE)), 'modules': modules,
+                  'code': code_fingerprint(app_path, modules),
+                  'analyses': [{'label': option['label'], 'value': option['value']} for option in dropdown.options],
+                  'default': dropdown.value, 'filters': filter_options(module.dataset.frame),
+                  'responses': responses}
+    finally:
+        os.chdir(cwd)
+
+    content = gzip.compress(json.dumps(bundle, separators=(',', ':'), sort_keys=True).encode(),
+                            compresslevel=9, mtime=0)
+    try:
+        with open(output, 'rb') as f:
+            unchanged = f.read() == content
+    except OSError:
+        unchanged = False
+    if not unchanged:
+        tmp_path = f"{output}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, output)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prebuild the serverless dashboard responses.')
+    parser.add_argument('app', nargs='?', default='api/index.py')
+    parser.add_argument('-o', '--output', help=f"bundle path (default: {BUNDLE_NAME} next to the app)")
+    parser.add_argument('--data-dir', help="directory holding the app's CSV (default: the app's directory)")
+    parser.add_argument('--check', action='store_true',
+                        help='exit with an error if the bundle is stale instead of rebuilding it')
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(args.app)), BUNDLE_NAME)
+    if args.check:
+        try:
+            check_bundle(args.app, output, args.data_dir)
+        except (OSError, ValueError) as error:
+            sys.exit(f"Stale bundle: {error}. Rebuild it with `python -m growth.bundle {args.app}`")
+        print(f"{output} is up to date")
+        return
+    start = time.perf_counter()
+    timings = build_bundle(args.app, output, args.data_dir)
+    analyses = sum(step.startswith('analysis:') for step in timings)
+    print(f"Wrote {output} ({os.path.getsize(output) / 1024:.0f} KB, {analyses} analyses) "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
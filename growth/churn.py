@@ -0,0 +1,119 @@
+# Churn drivers: which measures and segments move with `churned`
+#
+# Everything is derived from additive per-class accumulators (users, and the
+# sum and sum of squares of each measure, for churned and retained users, plus
+# user counts per country / plan / subscription value and class). They are read
+# off the aggregate cube, merged across chunks and updated with the
+# contribution of each ingested batch, so ranking the drivers costs
+# O(features) instead of a correlation matrix over the full table.
+import numpy as np
+import pandas as pd
+
+from growth.aggregates import KEYS, MEASURES, AggregateCube
+
+SEGMENT_KEYS = [key for key in KEYS if key != 'churned']
+CLASSES = [0, 1]
+
+
+class ChurnDrivers:
+    def __init__(self, counts, sums, sumsq, segments):
+        # counts: users per class; sums / sumsq: class x measure; segments: {key: value x class counts}
+        self.counts = counts
+        self.sums = sums
+        self.sumsq = sumsq
+        self.segments = segments
+
+    @classmethod
+    def from_cube(cls, cube):
+        table = cube.table
+        churned = table.index.get_level_values('churned')
+        # Cells with an unknown churn status carry no signal either way
+        table = table[~pd.isna(churned)]
+        by_class = table.groupby(level='churned', sort=True).sum().reindex(CLASSES, fill_value=0)
+        counts = by_class[('count', '')].to_numpy(dtype='float64')
+        sums = by_class.xs('sum', axis=1, level=1)[MEASURES].to_numpy(dtype='float64')
+        sumsq = by_class.xs('sumsq', axis=1, level=1)[MEASURES].to_numpy(dtype='float64')
+        segments = {}
+        for key in SEGMENT_KEYS:
+            segment = (table[('count', '')].groupby(level=[key, 'churned'], dropna=False, observed=True).sum()
+                       .unstack(fill_value=0).reindex(columns=CLASSES, fill_value=0))
+            segment.columns.name = None
+            segments[key] = segment.astype('float64')
+        return cls(counts, sums, sumsq, segments)
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls.from_cube(AggregateCube.from_frame(df))
+
+    def merge(self, other):
+        """Combine with the drivers of a disjoint set of rows (e.g. another chunk or batch)."""
+        return self._combine(other, 1)
+
+    def subtract(self, other):
+        """Remove the contribution of rows summarized by `other` (e.g. rows being replaced)."""
+        return self._combine(other, -1)
+
+    def _combine(self, other, sign):
+        segments = {}
+        for key, segment in self.segments.items():
+            combined = segment.add(other.segments[key] * sign, fill_value=0)
+            segments[key] = combined[combined.sum(axis=1) > 0]
+        return ChurnDrivers(self.counts + sign * other.counts, self.sums + sign * other.sums,
+                            self.sumsq + sign * other.sumsq, segments)
+
+    @property
+    def n_users(self):
+        return self.counts.sum()
+
+    def point_biserial(self):
+        """Correlation of every measure with `churned` (Pearson against a 0/1 variable), strongest first.
+
+        Measures are ordered by absolute correlation: a strong negative one
+        (more activity, less churn) is as much a driver as a positive one.
+        """
+        n = self.n_users
+        n_churned = self.counts[1]
+        sum_x = self.sums.sum(axis=0)
+        sum_xx = self.sumsq.sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            denominator = np.sqrt((n * sum_xx - sum_x ** 2) * (n * n_churned - n_churned ** 2))
+            correlation = np.where(denominator > 0, (n * self.sums[1] - sum_x * n_churned) / denominator, np.nan)
+        correlation = pd.Series(correlation, index=MEASURES)
+        return correlation.reindex(correlation.abs().sort_values(ascending=False).index)
+
+    def mutual_information(self):
+        """Mutual information (bits) between each segment key and `churned`, highest first."""
+        information = {}
+        for key, segment in self.segments.items():
+            joint = segment.to_numpy() / max(segment.to_numpy().sum(), 1)
+            expected = joint.sum(axis=1, keepdims=True) * joint.sum(axis=0, keepdims=True)
+            nonzero = joint > 0
+            information[key] = float((joint[nonzero] * np.log2(joint[nonzero] / expected[nonzero])).sum())
+        return pd.Series(information, dtype='float64').sort_values(ascending=False)
+
+    def segment_correlation(self, key):
+        """Point-biserial correlation of each `key` value (as a 0/1 indicator) with `churned`, highest first."""
+        segment = self.segments[key]
+        churned = segment[1].to_numpy()
+        in_segment = segment.sum(axis=1).to_numpy()
+        n = self.n_users
+        n_churned = self.counts[1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            denominator = np.sqrt(in_segment * (n - in_segment) * n_churned * (n - n_churned))
+            correlation = np.where(denominator > 0, (n * churned - in_segment * n_churned) / denominator, np.nan)
+        return pd.Series(correlation, index=segment.index, name=key).sort_values(ascending=False)
+
+    def segment_drivers(self):
+        """For each segment key: its mutual information and the value most associated with churn.
+
+        Keys with a single value among these rows (e.g. fixed by a filter) are left out.
+        """
+        rows = []
+        for key, information in self.mutual_information().items():
+            if len(self.segments[key]) < 2:
+                continue
+            correlation = self.segment_correlation(key).dropna()
+            rows.append({'key': key, 'mutual_information': information,
+                         'value': correlation.index[0] if len(correlation) else None,
+                         'correlation': correlation.iloc[0] if len(correlation) else np.nan})
+        return pd.DataFrame(rows, columns=['key', 'mutual_information', 'value', 'correlation'])
@@ -0,0 +1,17 @@
+# Data Exploration & Cleaning step shared by the dashboard, the streaming
+# pipeline and the benchmarks
+MEDIAN_FILL_COLUMNS = ['total_sessions', 'page_views', 'days_active']
+ZERO_FILL_COLUMNS = ['monthly_revenue']
+
+
+def clean_growth_data(df):
+    """Fill missing values and drop duplicate rows; returns (df, duplicates_removed)."""
+    # Handle missing values: medians for engagement columns, 0 for revenue
+    fill_values = {column: df[column].median() for column in MEDIAN_FILL_COLUMNS}
+    fill_values.update({column: 0 for column in ZERO_FILL_COLUMNS})
+    df = df.fillna(fill_values)
+
+    # Remove duplicates
+    rows_before = len(df)
+    df = df.drop_duplicates()
+    return df, rows_before - len(df)
@@ -0,0 +1,191 @@
+# Cohort retention, time to upgrade and survival curves
+#
+# install_date, last_active_date and pro_upgrade_date are converted once per
+# dataset version to small integer day offsets from the first install, and the
+# grouping columns to integer codes. Every analysis is then a handful of
+# bincounts and cumulative sums over those arrays, restricted to a filtered
+# view's rows when given, so the cost is linear in the selected rows with no
+# per-user Python work.
+import numpy as np
+import pandas as pd
+
+GROUP_COLUMNS = ['subscription_type', 'country', 'plan_type']
+# Same buckets as Task_4: (0, 10], (10, 50], (50, 100], (100, inf) sessions
+ENGAGEMENT_BINS = [0, 10, 50, 100]
+ENGAGEMENT_LABELS = ['Low', 'Medium', 'High', 'Very High']
+
+_MAX_CACHED_COHORTS = 4
+_cohorts = {}
+
+
+def _take(values, rows):
+    return values if rows is None else values[rows]
+
+
+class Cohorts:
+    def __init__(self, df, version=None):
+        self.version = version
+        self.n_rows = len(df)
+        install = df['install_date'].to_numpy(dtype='datetime64[D]')
+        last = df['last_active_date'].to_numpy(dtype='datetime64[D]')
+        upgrade = df['pro_upgrade_date'].to_numpy(dtype='datetime64[D]')
+        dated = ~np.isnat(install)
+        self.origin = install[dated].min() if dated.any() else np.datetime64('1970-01-01', 'D')
+        # Users are observed up to the latest activity in the table
+        self.end = int((np.nanmax(np.where(np.isnat(last), install, last)) - self.origin).astype('int64')) \
+            if dated.any() else 0
+        # Weeks start on Monday; 1970-01-01 was a Thursday
+        self.weekday = (int(self.origin.astype('int64')) + 3) % 7
+        dtype = np.int16 if self.end < np.iinfo(np.int16).max else np.int32
+
+        def offsets(days, fallback):
+            days = np.where(np.isnat(days), fallback, days)
+            return (days - self.origin).astype('int64').clip(0, self.end).astype(dtype)
+
+        self.dated = dated
+        self.install = offsets(install, self.origin)
+        self.last = np.maximum(offsets(last, install), self.install)
+        self.upgraded = ~np.isnat(upgrade) & dated
+        self.upgrade = np.where(self.upgraded, np.maximum(offsets(upgrade, self.origin), self.install), -1).astype(dtype)
+        self.churned = df['churned'].to_numpy(dtype='float64', na_value=0) == 1
+
+        self.groups = {}
+        for column in GROUP_COLUMNS:
+            codes, labels = pd.factorize(df[column], sort=True, use_na_sentinel=True)
+            self.groups[column] = (codes.astype(np.int32), list(labels))
+        sessions = df['total_sessions'].to_numpy(dtype='float64', na_value=np.nan)
+        codes = np.searchsorted(ENGAGEMENT_BINS, sessions, side='left') - 1
+        codes[np.isnan(sessions)] = -1
+        self.groups['engagement_level'] = (codes.astype(np.int32), ENGAGEMENT_LABELS)
+        self._periods = {}
+
+    def _rows(self, rows):
+        """Selected rows that have an install date."""
+        if rows is None:
+            return None if self.dated.all() else np.flatnonzero(self.dated)
+        return rows[self.dated[rows]]
+
+    def _period_index(self, offsets, period):
+        # Day offsets map to periods through a table with one entry per day in the data
+        table = self._periods.get(period)
+        if table is None:
+            days = np.arange(self.end + 1)
+            if period == 'week':
+                table = (days + self.weekday) // 7
+            elif period == 'month':
+                table = (self.origin + days).astype('datetime64[M]') - self.origin.astype('datetime64[M]')
+            else:
+                raise ValueError(f"Unknown period: {period}")
+            table = table.astype(np.int64)
+            self._periods[period] = table
+        return table[offsets]
+
+    def _period_labels(self, period, n_periods):
+        if period == 'week':
+            starts = self.origin - self.weekday + 7 * np.arange(n_periods)
+            return pd.Index(np.datetime_as_string(starts, unit='D'), name='cohort')
+        starts = self.origin.astype('datetime64[M]') + np.arange(n_periods)
+        return pd.Index(np.datetime_as_string(starts, unit='M'), name='cohort')
+
+    def retention(self, period='month', rows=None):
+        """Share of each install cohort still active k periods after installing.
+
+        Rows are install weeks or months, columns the number of periods since
+        install; cells the data cannot observe yet are NaN.
+        """
+        rows = self._rows(rows)
+        cohort = self._period_index(_take(self.install, rows), period)
+        age = self._period_index(_take(self.last, rows), period) - cohort
+        n_periods = int(self._period_index(np.array([self.end]), period)[0]) + 1
+        # Users whose last activity fell in each (cohort, age) cell, then the
+        # number active at or beyond each age by a reverse cumulative sum
+        counts = np.bincount(cohort * n_periods + age, minlength=n_periods * n_periods).reshape(n_periods, n_periods)
+        active = counts[:, ::-1].cumsum(axis=1)[:, ::-1].astype('float64')
+        sizes = active[:, :1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            retention = active / sizes
+        observed = np.arange(n_periods)[:, None] + np.arange(n_periods)[None, :] < n_periods
+        retention[~observed | (sizes == 0)] = np.nan
+        table = pd.DataFrame(retention, index=self._period_labels(period, n_periods),
+                             columns=pd.RangeIndex(n_periods, name=f"{period}s since install"))
+        return table[sizes[:, 0] > 0]
+
+    def upgrade_times(self, rows=None):
+        """Days from install to upgrade for every selected user who upgraded."""
+        rows = self._rows(rows)
+        upgraded = _take(self.upgraded, rows)
+        return (_take(self.upgrade, rows)[upgraded] - _take(self.install, rows)[upgraded]).astype(np.int64)
+
+    def mean_upgrade_time(self, rows=None):
+        times = self.upgrade_times(rows)
+        return times.mean() if len(times) else np.nan
+
+    def upgrade_distribution(self, bin_days=7, rows=None):
+        """Number of upgrades per `bin_days`-day bucket of time since install."""
+        counts = np.bincount(self.upgrade_times(rows) // bin_days, minlength=self.end // bin_days + 1)
+        return pd.Series(counts, index=pd.RangeIndex(0, len(counts) * bin_days, bin_days, name='days to upgrade'),
+                         name='upgrades')
+
+    def upgrade_time_by(self, by, rows=None):
+        """Mean days to upgrade per value of `by` (a GROUP_COLUMNS entry or 'engagement_level')."""
+        rows = self._rows(rows)
+        codes, labels = self.groups[by]
+        upgraded = _take(self.upgraded, rows)
+        codes = _take(codes, rows)[upgraded]
+        times = _take(self.upgrade, rows)[upgraded].astype(np.int64) - _take(self.install, rows)[upgraded]
+        known = codes >= 0
+        counts = np.bincount(codes[known], minlength=len(labels))
+        totals = np.bincount(codes[known], weights=times[known], minlength=len(labels))
+        series = pd.Series(totals / np.maximum(counts, 1), index=pd.Index(labels, name=by), name='days to upgrade')
+        return series[counts > 0].sort_values()
+
+    def survival(self, event='churn', by=None, rows=None):
+        """Kaplan-Meier curve of the share of users without `event` ('churn' or 'upgrade') by day since install.
+
+        Users who have not had the event are censored: at the end of the data
+        while still active, at their last activity once churned. With `by`,
+        there is one column per value of that column.
+        """
+        rows = self._rows(rows)
+        install = _take(self.install, rows).astype(np.int64)
+        churned = _take(self.churned, rows)
+        censored_at = np.where(churned, _take(self.last, rows), self.end) - install
+        if event == 'churn':
+            happened = churned
+            time = censored_at
+        elif event == 'upgrade':
+            happened = _take(self.upgraded, rows)
+            time = np.where(happened, _take(self.upgrade, rows) - install, censored_at)
+        else:
+            raise ValueError(f"Unknown event: {event}")
+
+        if by is None:
+            codes, labels = np.zeros(len(time), dtype=np.int64), ['All']
+        else:
+            codes, labels = self.groups[by]
+            codes = _take(codes, rows)
+            known = codes >= 0
+            codes, time, happened = codes[known], time[known], happened[known]
+        n_days = self.end + 1
+        cells = codes.astype(np.int64) * n_days + time
+        exits = np.bincount(cells, minlength=len(labels) * n_days).reshape(len(labels), n_days)
+        events = np.bincount(cells, weights=happened, minlength=len(labels) * n_days).reshape(len(labels), n_days)
+        at_risk = exits[:, ::-1].cumsum(axis=1)[:, ::-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            hazard = np.where(at_risk > 0, events / at_risk, 0.0)
+        curves = np.cumprod(1 - hazard, axis=1)
+        curves[at_risk == 0] = np.nan
+        table = pd.DataFrame(curves.T, index=pd.RangeIndex(n_days, name='days since install'),
+                             columns=pd.Index(labels, name=by))
+        return table.loc[:, at_risk[:, 0] > 0]
+
+
+def get_cohorts(df, version):
+    """Return the Cohorts of `df`, building them once per dataset version."""
+    cohorts = _cohorts.get(version)
+    if cohorts is None:
+        cohorts = Cohorts(df, version)
+        _cohorts[version] = cohorts
+        while len(_cohorts) > _MAX_CACHED_COHORTS:
+            _cohorts.pop(next(iter(_cohorts)))
+    return cohorts
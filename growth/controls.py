@@ -0,0 +1,50 @@
+# Dash controls for the cross-filters
+#
+# Kept apart from growth.filters, which needs numpy and pandas, so the controls
+# can also be built from plain option lists: the serverless app renders them
+# from its prebuilt bundle without loading the data.
+FILTER_COLUMNS = ['country', 'plan_type', 'subscription_type']
+DATE_COLUMN = 'install_date'
+FILTER_IDS = {'country': 'country-filter', 'plan_type': 'plan-filter', 'subscription_type': 'subscription-filter'}
+DATE_FILTER_ID = 'install-date-filter'
+# The control properties holding the choices, in the order filter_choices returns them
+FILTER_CHOICE_PROPS = ([(FILTER_IDS[column], 'options') for column in FILTER_COLUMNS]
+                       + [(DATE_FILTER_ID, 'min_date_allowed'), (DATE_FILTER_ID, 'max_date_allowed')])
+
+
+def filter_options(df):
+    """Values of each filter column and the [first, last] install date of `df`, as JSON-ready lists."""
+    options = {column: [str(value) for value in sorted(df[column].dropna().unique())] for column in FILTER_COLUMNS}
+    dates = df[DATE_COLUMN].dropna()
+    options[DATE_COLUMN] = [dates.min().date().isoformat(), dates.max().date().isoformat()] if len(dates) else [None, None]
+    return options
+
+
+def filter_choices(options):
+    """Values for FILTER_CHOICE_PROPS: each dropdown's options, then the first and last install date.
+
+    `options` is a table to take the values from, or the output of `filter_options`.
+    """
+    if not isinstance(options, dict):
+        options = filter_options(options)
+    dropdowns = [[{'label': value, 'value': value} for value in options[column]] for column in FILTER_COLUMNS]
+    return dropdowns + list(options[DATE_COLUMN])
+
+
+def filter_controls(options, style=None):
+    """Dropdowns for each filter column and an install-date range picker.
+
+    `options` is a table to take the values from, or the output of `filter_options`.
+    """
+    from dash import dcc, html
+
+    *dropdowns, first, last = filter_choices(options)
+    labels = {'country': 'Country', 'plan_type': 'Plan', 'subscription_type': 'Subscription'}
+    controls = [dcc.Dropdown(id=FILTER_IDS[column], options=choices, multi=True,
+                             placeholder=f"All {labels[column].lower()}s", style={'flex': '1', 'minWidth': '160px'})
+                for column, choices in zip(FILTER_COLUMNS, dropdowns)]
+    controls.append(dcc.DatePickerRange(id=DATE_FILTER_ID, min_date_allowed=first, max_date_allowed=last,
+                                        start_date_placeholder_text='Installed from',
+                                        end_date_placeholder_text='Installed to', clearable=True))
+    return html.Div(controls, style=style or {'display': 'flex', 'gap': '10px', 'width': '90%',
+                                              'margin': 'auto', 'marginBottom': '20px'})
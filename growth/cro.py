@@ -0,0 +1,158 @@
+# Monte Carlo A/B tests and power analysis for conversion-rate changes
+#
+# Experiments are simulated in batches: every arm of every experiment is one
+# binomial draw, and all of them are tested at once with a vectorized 2x2
+# chi-square test (Yates-corrected, as chi2_contingency does in Task_6). The
+# baseline is the Free -> Pro rate of the rows being analysed. Sweeps are split
+# into fixed chunks with independent random streams, so results do not depend
+# on whether the chunks run in this process or in a process pool.
+import os
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+N_EXPERIMENTS = 2000
+UPLIFTS = [0.05, 0.10, 0.20]
+ALPHA = 0.05
+TARGET_POWER = 0.8
+N_SIZES = 24
+# Experiments per chunk, and draws below which a process pool costs more than it saves
+_CHUNK_EXPERIMENTS = 500
+_POOL_MIN_DRAWS = 50_000_000
+
+
+def baseline(cube):
+    """Users, Pro upgrades, Free -> Pro rate and mean monthly revenue per Pro user of `cube`'s rows."""
+    pro = {'subscription_type': 'Pro'}
+    upgrades = int(cube.rollup(stat='count', where=pro))
+    revenue = cube.rollup(measure='monthly_revenue', stat='mean', where=pro)
+    return {'users': cube.n_rows, 'upgrades': upgrades, 'rate': upgrades / cube.n_rows if cube.n_rows else np.nan,
+            'revenue_per_upgrade': 0.0 if np.isnan(revenue) else float(revenue)}
+
+
+def _critical_value(alpha):
+    # chi-square with one degree of freedom is a squared standard normal
+    return NormalDist().inv_cdf(1 - alpha / 2) ** 2
+
+
+def significant(conversions_a, conversions_b, n_a, n_b, alpha=ALPHA):
+    """Whether each simulated 2x2 table differs at level `alpha` (chi-square with Yates' correction)."""
+    conversions_a = np.asarray(conversions_a, dtype='float64')
+    conversions_b = np.asarray(conversions_b, dtype='float64')
+    n_a = np.asarray(n_a, dtype='float64')
+    n_b = np.asarray(n_b, dtype='float64')
+    total = n_a + n_b
+    converted = conversions_a + conversions_b
+    difference = np.abs(conversions_a * (n_b - conversions_b) - conversions_b * (n_a - conversions_a))
+    numerator = total * np.maximum(difference - total / 2, 0) ** 2
+    denominator = n_a * n_b * converted * (total - converted)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        statistic = np.where(denominator > 0, numerator / denominator, 0.0)
+    return statistic > _critical_value(alpha)
+
+
+def _simulate_chunk(task):
+    # Number of experiments per (uplift, size) where B beats A significantly
+    rate, uplifts, sizes, n_experiments, alpha, seed = task
+    rng = np.random.default_rng(seed)
+    shape = (len(uplifts), len(sizes), n_experiments)
+    sizes = np.broadcast_to(np.asarray(sizes)[None, :, None], shape)
+    treated = np.minimum(rate * (1 + np.asarray(uplifts)), 1.0)[:, None, None]
+    conversions_a = rng.binomial(sizes, rate)
+    conversions_b = rng.binomial(sizes, np.broadcast_to(treated, shape))
+    wins = significant(conversions_a, conversions_b, sizes, sizes, alpha) & (conversions_b > conversions_a)
+    return wins.sum(axis=2)
+
+
+def _uplift_labels(uplifts):
+    return pd.Index([f"+{uplift:.0%}" for uplift in uplifts], name='uplift')
+
+
+def required_sample_size(rate, uplift, alpha=ALPHA, power=TARGET_POWER):
+    """Users per arm to detect a relative `uplift` on `rate` (two-sided normal approximation)."""
+    treated = min(rate * (1 + uplift), 1.0)
+    if treated <= rate:
+        return np.nan
+    normal = NormalDist()
+    z_alpha = normal.inv_cdf(1 - alpha / 2)
+    z_power = normal.inv_cdf(power)
+    pooled = (rate + treated) / 2
+    n = (z_alpha * np.sqrt(2 * pooled * (1 - pooled))
+         + z_power * np.sqrt(rate * (1 - rate) + treated * (1 - treated))) ** 2 / (treated - rate) ** 2
+    return int(np.ceil(n))
+
+
+def default_sizes(rate, uplifts=UPLIFTS, n_sizes=N_SIZES):
+    """Users-per-arm grid spanning the sample sizes the uplifts need."""
+    needed = [required_sample_size(rate, uplift) for uplift in uplifts]
+    needed = [n for n in needed if not np.isnan(n)] or [1000]
+    return np.unique(np.geomspace(max(min(needed) / 8, 50), max(needed) * 2, n_sizes).astype(np.int64))
+
+
+def power_curve(rate, uplifts=UPLIFTS, sizes=None, n_experiments=N_EXPERIMENTS, alpha=ALPHA, seed=0,
+                max_workers=None, progress=None):
+    """Simulated power (share of experiments where B wins significantly) by users per arm and uplift.
+
+    `progress`, if given, is called after each chunk of experiments with the
+    fraction done and the curve from the experiments simulated so far.
+    """
+    sizes = default_sizes(rate, uplifts) if sizes is None else np.asarray(sizes, dtype=np.int64)
+    chunks = [min(_CHUNK_EXPERIMENTS, n_experiments - start) for start in range(0, n_experiments, _CHUNK_EXPERIMENTS)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    tasks = [(rate, list(uplifts), sizes, chunk, alpha, child) for chunk, child in zip(chunks, seeds)]
+    draws = 2 * len(uplifts) * len(sizes) * n_experiments
+
+    def curve(wins, n):
+        return pd.DataFrame((wins / n).T, index=pd.Index(sizes, name='users per arm'), columns=_uplift_labels(uplifts))
+
+    def accumulate(results):
+        wins, done = 0, 0
+        for chunk, chunk_wins in zip(chunks, results):
+            wins, done = wins + chunk_wins, done + chunk
+            if progress is not None and done < n_experiments:
+                progress(done / n_experiments, curve(wins, done))
+        return wins
+
+    if len(tasks) > 1 and draws >= _POOL_MIN_DRAWS and max_workers != 1:
+        with ProcessPoolExecutor(max_workers=min(max_workers or os.cpu_count() or 1, len(tasks))) as pool:
+            wins = accumulate(pool.map(_simulate_chunk, tasks))
+    else:
+        wins = accumulate(map(_simulate_chunk, tasks))
+    return curve(wins, n_experiments)
+
+
+def sample_sizes(rate, uplifts=UPLIFTS, curve=None, alpha=ALPHA, power=TARGET_POWER):
+    """Users per arm needed for `power`, analytically and where the simulated curve first reaches it."""
+    rows = []
+    for uplift, label in zip(uplifts, _uplift_labels(uplifts)):
+        simulated = np.nan
+        if curve is not None:
+            values = curve[label].to_numpy()
+            reached = np.flatnonzero(values >= power)
+            if len(reached) and reached[0] > 0:
+                # Interpolate between the grid sizes either side of the crossing
+                lo, hi = reached[0] - 1, reached[0]
+                sizes = curve.index.to_numpy(dtype='float64')
+                simulated = np.interp(power, [values[lo], values[hi]], [sizes[lo], sizes[hi]])
+            elif len(reached):
+                simulated = float(curve.index[0])
+        rows.append({'uplift': label, 'analytic': required_sample_size(rate, uplift, alpha, power),
+                     'simulated': simulated})
+    return pd.DataFrame(rows).set_index('uplift')
+
+
+def expected_uplift(users, rate, uplifts=UPLIFTS, revenue_per_upgrade=0.0, n_experiments=N_EXPERIMENTS,
+                    interval=0.9, seed=0):
+    """Additional Pro upgrades (with a simulated `interval`) and monthly revenue if `users` convert at
+    `rate` raised by each uplift, relative to the current rate."""
+    rng = np.random.default_rng(seed)
+    treated = np.minimum(rate * (1 + np.asarray(uplifts)), 1.0)
+    upgrades = rng.binomial(users, np.broadcast_to(treated[:, None], (len(uplifts), n_experiments))) - users * rate
+    tail = (1 - interval) / 2 * 100
+    low, high = np.percentile(upgrades, [tail, 100 - tail], axis=1)
+    additional = users * (treated - rate)
+    return pd.DataFrame({'additional_upgrades': additional, 'low': low, 'high': high,
+                         'monthly_revenue': additional * revenue_per_upgrade},
+                        index=_uplift_labels(uplifts))
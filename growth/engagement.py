@@ -0,0 +1,99 @@
+# Engagement scatter (total sessions vs days active) that scales with the user table
+#
+# Small tables are drawn point-for-point with WebGL traces. Above the point budget
+# the rows are down-sampled per subscription type, so the Free/Pro split is kept,
+# and above the density threshold the plot switches to server-side 2D histograms.
+# Either way, the payload sent to the browser is bounded by the budget or the
+# bin count rather than by the number of users.
+import os
+
+import numpy as np
+
+MODE_ENV = 'WPPOOL_SCATTER_MODE'
+POINT_BUDGET_ENV = 'WPPOOL_SCATTER_POINTS'
+DENSITY_THRESHOLD_ENV = 'WPPOOL_SCATTER_DENSITY_ROWS'
+
+MODES = ('auto', 'webgl', 'sample', 'density')
+DEFAULT_POINT_BUDGET = 5000
+DEFAULT_DENSITY_THRESHOLD = 250000
+DEFAULT_BINS = 60
+
+X, Y, COLOR = 'total_sessions', 'days_active', 'subscription_type'
+LABELS = {'total_sessions': 'Total Sessions', 'days_active': 'Days Active',
+          'subscription_type': 'Subscription Type'}
+
+
+def stratified_sample(df, by, n, seed=0):
+    """Sample about `n` rows of `df`, keeping each `by` group's share of the rows."""
+    if len(df) <= n:
+        return df
+    return df.groupby(by, observed=True, group_keys=False).sample(frac=n / len(df), random_state=seed)
+
+
+def density_bins(df, by, bins=DEFAULT_BINS):
+    """2D histogram of X vs Y per `by` group, on edges shared by every group."""
+    x = df[X].to_numpy(dtype='float64')
+    y = df[Y].to_numpy(dtype='float64')
+    x_edges = np.histogram_bin_edges(x, bins=bins)
+    y_edges = np.histogram_bin_edges(y, bins=bins)
+    codes, groups = df[by].factorize(sort=True)
+    histograms = {}
+    for code, group in enumerate(groups):
+        mask = codes == code
+        counts, _, _ = np.histogram2d(x[mask], y[mask], bins=[x_edges, y_edges])
+        histograms[group] = counts
+    return x_edges, y_edges, histograms
+
+
+def resolve_mode(n_rows, mode=None, point_budget=None, density_threshold=None):
+    mode = mode or os.environ.get(MODE_ENV, 'auto')
+    point_budget = point_budget or int(os.environ.get(POINT_BUDGET_ENV, DEFAULT_POINT_BUDGET))
+    density_threshold = density_threshold or int(os.environ.get(DENSITY_THRESHOLD_ENV, DEFAULT_DENSITY_THRESHOLD))
+    if mode not in MODES:
+        raise ValueError(f"Unknown engagement plot mode: {mode}")
+    if mode == 'auto':
+        if n_rows <= point_budget:
+            mode = 'webgl'
+        elif n_rows <= density_threshold:
+            mode = 'sample'
+        else:
+            mode = 'density'
+    return mode, point_budget
+
+
+def engagement_figure(df, title='User Engagement by Subscription Type', mode=None,
+                      point_budget=None, density_threshold=None, bins=DEFAULT_BINS):
+    import plotly.express as px
+
+    mode, point_budget = resolve_mode(len(df), mode, point_budget, density_threshold)
+    if mode == 'density':
+        return _density_figure(df, title, bins)
+
+    data = df[[X, Y, COLOR]]
+    if mode == 'sample' and len(data) > point_budget:
+        data = stratified_sample(data, COLOR, point_budget)
+        title = f"{title} (sample of {len(data):,} of {len(df):,} users)"
+    return px.scatter(data, x=X, y=Y, color=COLOR, render_mode='webgl',
+                      labels=LABELS, title=title,
+                      color_discrete_sequence=px.colors.qualitative.Pastel)
+
+
+def _density_figure(df, title, bins):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    x_edges, y_edges, histograms = density_bins(df, COLOR, bins)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+    fig = make_subplots(rows=1, cols=max(len(histograms), 1), shared_yaxes=True,
+                        subplot_titles=[str(group) for group in histograms])
+    for column, counts in enumerate(histograms.values(), start=1):
+        # histogram2d indexes counts as [x, y]; heatmaps expect rows of y
+        fig.add_trace(go.Heatmap(x=x_centers, y=y_centers, z=counts.T, coloraxis='coloraxis',
+                                 hovertemplate='Sessions %{x:.0f}<br>Days active %{y:.0f}<br>Users %{z:.0f}<extra></extra>'),
+                      row=1, col=column)
+        fig.update_xaxes(title_text=LABELS[X], row=1, col=column)
+    fig.update_yaxes(title_text=LABELS[Y], row=1, col=1)
+    fig.update_layout(title=f"{title} (user density, {len(df):,} users)",
+                      coloraxis={'colorscale': 'Blues', 'colorbar': {'title': {'text': 'Users'}}})
+    return fig
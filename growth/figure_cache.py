@@ -0,0 +1,196 @@
+# Server-side cache for rendered analysis responses
+#
+# A dashboard response depends only on the selected analysis, the filter state
+# and the dataset it was computed from, so it is cached under those three. Entries
+# are stored as plain component JSON: a hit goes straight back to Dash without
+# touching pandas or building Plotly figures. An optional on-disk tier keeps
+# responses across restarts and lets several workers share them.
+import functools
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request
+
+from growth.metrics import collect_phases
+
+MAX_ENTRIES_ENV = 'WPPOOL_FIGURE_CACHE_SIZE'
+DISK_DIR_ENV = 'WPPOOL_FIGURE_CACHE_DIR'
+DEFAULT_MAX_ENTRIES = 128
+DEFAULT_MAX_DISK_ENTRIES = 1024
+
+
+def to_payload(component):
+    """Serialize a Dash component tree into the JSON structure Dash sends to the browser."""
+    return json.loads(_to_json(component))
+
+
+def _to_json(component):
+    from plotly.io.json import to_json_plotly
+
+    return to_json_plotly(component)
+
+
+class FigureCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, disk_dir=None, max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(namespace, analysis, filters, fingerprint):
+        raw = json.dumps([namespace, analysis, filters, fingerprint], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def get(self, key, count_miss=True):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key)) as f:
+                    payload = json.load(f)
+            except (OSError, ValueError):
+                payload = None
+            if payload is not None:
+                self._remember(key, payload)
+                with self._lock:
+                    self.hits += 1
+                return payload
+
+        if count_miss:
+            with self._lock:
+                self.misses += 1
+        return None
+
+    def set(self, key, payload):
+        self._remember(key, payload)
+        if self.disk_dir:
+            try:
+                self._write_disk(key, payload)
+            except OSError:
+                pass
+
+    def _remember(self, key, payload):
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _write_disk(self, key, payload):
+        os.makedirs(self.disk_dir, exist_ok=True)
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+        entries = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith('.json')]
+        if len(entries) > self.max_disk_entries:
+            entries.sort(key=os.path.getmtime)
+            for stale in entries[:len(entries) - self.max_disk_entries]:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def clear(self, disk=False):
+        with self._lock:
+            self._entries.clear()
+        if disk and self.disk_dir and os.path.isdir(self.disk_dir):
+            for name in os.listdir(self.disk_dir):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+
+def default_cache():
+    return FigureCache(max_entries=int(os.environ.get(MAX_ENTRIES_ENV, DEFAULT_MAX_ENTRIES)),
+                       disk_dir=os.environ.get(DISK_DIR_ENV) or None)
+
+
+def cached_analysis(cache, namespace, fingerprint, metrics=None, ignore=()):
+    """Decorate a Dash callback `f(analysis, *filters)` so its responses are cached.
+
+    `fingerprint` is a callable returning the current dataset version, so new
+    data automatically misses the cache instead of serving stale figures.
+    Arguments named in `ignore` (e.g. an input that only triggers a refresh)
+    are left out of the key. Omitted and empty filters count as None, so
+    `f(analysis)` and the callback's `f(analysis, None, [], ...)` share an
+    entry. When `metrics` (a growth.metrics.CallbackMetrics) is given, every
+    call records its latency, cache result and, on a miss, the compute /
+    figure / serialize split and the payload size. The wrapper's `cache_key`
+    returns the key of a call, and `cached` its cached response or None.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def cache_key(analysis, *filters):
+            arguments = signature.bind(analysis, *filters)
+            arguments.apply_defaults()
+            values = [None if value in (None, [], '') else value
+                      for name, value in list(arguments.arguments.items())[1:] if name not in ignore]
+            return cache.key(namespace, analysis, values, fingerprint())
+
+        def lookup(analysis, key, start, count_miss):
+            payload = cache.get(key, count_miss)
+            if payload is not None and metrics is not None:
+                metrics.observe(analysis, time.perf_counter() - start, cache_hit=True)
+            return payload
+
+        def cached(analysis, *filters):
+            # A miss is counted by the call that renders the response
+            return lookup(analysis, cache_key(analysis, *filters), time.perf_counter(), count_miss=False)
+
+        @functools.wraps(func)
+        def wrapper(analysis, *filters):
+            start = time.perf_counter()
+            key = cache_key(analysis, *filters)
+            payload = lookup(analysis, key, start, count_miss=True)
+            if payload is not None:
+                return payload
+
+            with collect_phases() as timings:
+                component = func(analysis, *filters)
+            rendered = time.perf_counter()
+            serialized = _to_json(component)
+            payload = json.loads(serialized)
+            cache.set(key, payload)
+            if metrics is not None:
+                finished = time.perf_counter()
+                timings['compute'] = max(rendered - start - timings.get('figure', 0.0), 0.0)
+                timings['serialize'] = finished - rendered
+                metrics.observe(analysis, finished - start, cache_hit=False, timings=timings,
+                                payload_bytes=len(serialized))
+            return payload
+        wrapper.cache_key = cache_key
+        wrapper.cached = cached
+        return wrapper
+    return decorator
+
+
+def enable_layout_etags(app):
+    """Answer conditional GETs of the Dash layout and dependencies with 304 Not Modified."""
+    @app.server.after_request
+    def add_etag(response):
+        if (request.method == 'GET' and response.status_code == 200
+                and request.path.endswith(('/_dash-layout', '/_dash-dependencies'))):
+            response.add_etag()
+            response.make_conditional(request)
+        return response
+    return app
@@ -0,0 +1,172 @@
+# Cross-filters (country, plan, subscription, install date) shared by every analysis
+#
+# Each country, plan and subscription value has a packed bitmap of its rows, and
+# the install-date range is answered from the row ids sorted by install date, so
+# combining filters is a few bitwise ANDs over n/8 bytes rather than boolean
+# masks over the frame. The filter columns are cube keys, so the filtered cube is
+# a selection of cells; only a date range needs rows summarized, using the
+# cube's precomputed cell codes instead of a regroup.
+import json
+
+import numpy as np
+import pandas as pd
+
+from growth.aggregates import TOP_N, TOP_USER_COLUMNS, AggregateCube, cell_codes, top_users
+# The filter columns and their Dash controls, which need no numpy or pandas
+from growth.controls import DATE_COLUMN, FILTER_COLUMNS, filter_controls
+
+_SCAN_BLOCK = 4096
+_SPARSE_RATIO = 64
+# Set bits in each possible byte, for counting a packed bitmap
+_BIT_COUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+def make_filters(countries=None, plans=None, subscriptions=None, start_date=None, end_date=None):
+    """Build a filter dict from the dashboard's filter control values (unset controls are ignored)."""
+    filters = {}
+    for column, values in zip(FILTER_COLUMNS, (countries, plans, subscriptions)):
+        if values:
+            filters[column] = [values] if isinstance(values, str) else sorted(values)
+    if start_date or end_date:
+        filters[DATE_COLUMN] = [start_date, end_date]
+    return filters
+
+
+def filters_key(filters):
+    return json.dumps(filters, sort_keys=True, default=str)
+
+
+def _day(value):
+    return np.datetime64(pd.Timestamp(value).date(), 'D')
+
+
+class FilterIndex:
+    def __init__(self, df):
+        self.n_rows = len(df)
+        self.bitmaps = {}
+        for column in FILTER_COLUMNS:
+            codes, values = pd.factorize(df[column], sort=True)
+            self.bitmaps[column] = {value: np.packbits(codes == code) for code, value in enumerate(values)}
+        days = df[DATE_COLUMN].to_numpy(dtype='datetime64[D]')
+        # NaT sorts last, so the dated rows are order[:n_dated]
+        self.order = np.argsort(days, kind='stable')
+        self.sorted_days = days[self.order]
+        self.n_dated = int(np.count_nonzero(~np.isnat(days)))
+        self.cells, self.cell_index = cell_codes(df)
+        # Rows by total sessions, most first (ties in row order, like nlargest)
+        sessions = df['total_sessions'].to_numpy(dtype='float64', na_value=np.nan)
+        self.by_sessions = np.argsort(-sessions, kind='stable')[:np.count_nonzero(~np.isnan(sessions))]
+
+    def select(self, filters):
+        """Packed bitmap of the rows matching every filter; values within a column are OR-ed."""
+        selected = self._key_bitmap(filters)
+        if filters.get(DATE_COLUMN):
+            selected &= self._date_bitmap(*filters[DATE_COLUMN])
+        return selected
+
+    def _key_bitmap(self, filters):
+        selected = np.packbits(np.ones(self.n_rows, dtype=bool))
+        for column in FILTER_COLUMNS:
+            if not filters.get(column):
+                continue
+            matching = np.zeros_like(selected)
+            for value in filters[column]:
+                bitmap = self.bitmaps[column].get(value)
+                if bitmap is not None:
+                    matching |= bitmap
+            selected &= matching
+        return selected
+
+    def _date_bitmap(self, start=None, end=None):
+        dated = self.sorted_days[:self.n_dated]
+        lo = 0 if start is None else np.searchsorted(dated, _day(start), 'left')
+        hi = self.n_dated if end is None else np.searchsorted(dated, _day(end), 'right')
+        # Scatter whichever of the range or its complement touches fewer rows
+        if 2 * (hi - lo) <= self.n_rows:
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[self.order[lo:hi]] = True
+        else:
+            mask = np.ones(self.n_rows, dtype=bool)
+            mask[self.order[:lo]] = False
+            mask[self.order[hi:]] = False
+        return np.packbits(mask)
+
+    def rows(self, bitmap):
+        """Row positions set in `bitmap`."""
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.n_rows))
+
+    def top_users(self, df, bitmap):
+        """TOP_N users by total sessions among the rows set in `bitmap`."""
+        found = []
+        for start in range(0, len(self.by_sessions), _SCAN_BLOCK):
+            block = self.by_sessions[start:start + _SCAN_BLOCK]
+            hits = block[(bitmap[block >> 3] >> (7 - (block & 7))) & 1 == 1]
+            found.extend(hits[:TOP_N - len(found)])
+            if len(found) == TOP_N:
+                break
+        return df[TOP_USER_COLUMNS].iloc[found]
+
+    def view(self, df, filters, base, version=None):
+        """Return the FilteredView of `df` matching `filters`.
+
+        `base` is the cube of all of `df`. Every filter column is also a cube
+        key, so those filters select whole cells of `base`. A date range is
+        summarized from whichever is smaller: the rows inside it, or the rows
+        it excludes, whose cube is subtracted from the selected cells.
+        """
+        table = base.table
+        for column in FILTER_COLUMNS:
+            if filters.get(column):
+                table = table[table.index.get_level_values(column).isin(filters[column])]
+        cube = AggregateCube(table, int(table[('count', '')].sum()), None)
+
+        selected = self.select(filters)
+        view = FilteredView(df, cube, self, selected)
+        n_selected = cube.n_rows
+        if filters.get(DATE_COLUMN):
+            n_selected = int(_BIT_COUNTS[selected].sum())
+            if 2 * n_selected <= cube.n_rows:
+                view.cube = AggregateCube.from_cells(df, self.cells, self.cell_index, view.rows)
+            else:
+                excluded = self.rows(self._key_bitmap(filters) & ~selected)
+                view.cube = cube.subtract(AggregateCube.from_cells(df, self.cells, self.cell_index, excluded))
+        if view.cube.top_users is None:
+            # Scanning the busiest users pays off unless the selection is sparse
+            if n_selected * _SPARSE_RATIO >= self.n_rows:
+                view.cube.top_users = self.top_users(df, selected)
+            else:
+                view.cube.top_users = top_users(df, view.rows)
+        view.cube.version = version
+        return view
+
+
+class FilteredView:
+    """The rows of a table matching a set of filters, with their own aggregate cube."""
+
+    def __init__(self, frame, cube, index=None, bitmap=None):
+        self.cube = cube
+        self._frame = frame
+        self._index = index
+        self._bitmap = bitmap
+        self._rows = None
+        self._selected = None
+
+    @property
+    def n_rows(self):
+        return self.cube.n_rows
+
+    @property
+    def rows(self):
+        """Positions of the selected rows in the full table (None when unfiltered)."""
+        if self._rows is None and self._bitmap is not None:
+            self._rows = self._index.rows(self._bitmap)
+        return self._rows
+
+    @property
+    def frame(self):
+        if self._bitmap is None:
+            return self._frame
+        if self._selected is None:
+            self._selected = self._frame.iloc[self.rows]
+        return self._selected
+
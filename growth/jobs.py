@@ -0,0 +1,242 @@
+# Background jobs for heavy analyses
+#
+# A heavy analysis is rendered by a small thread pool instead of the request
+# thread. The request waits briefly, so cached and quick results still come
+# back inline, then returns a progress view that the page polls. Jobs share the
+# figure cache's key (app, analysis, filters, dataset version) and are claimed
+# in a SQLite file shared by every process on the host. Identical requests, from any user or any
+# gunicorn worker, therefore wait on one computation. Progress, partial results
+# published with `report_progress` and the finished response are written to the
+# same file, so whichever worker receives a poll can answer it. A running job
+# sends a heartbeat every HEARTBEAT_SECONDS; one that misses them for
+# STALE_SECONDS (its worker was killed) is taken over by the next request for it.
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from growth.metrics import follow_profile
+
+STORE_ENV = 'WPPOOL_JOB_STORE'
+WORKERS_ENV = 'WPPOOL_JOB_WORKERS'
+DEFAULT_WORKERS = 2
+# Seconds a request waits for its job before answering with progress
+INLINE_WAIT = 0.3
+POLL_INTERVAL_MS = 750
+HEARTBEAT_SECONDS = 5
+STALE_SECONDS = 30
+# Finished jobs are kept this long for pollers, then purged
+RESULT_TTL = 600
+
+_current = threading.local()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL,
+    message TEXT,
+    partial TEXT,
+    result TEXT,
+    error TEXT,
+    updated REAL NOT NULL
+)
+"""
+
+
+def store_path():
+    return os.environ.get(STORE_ENV) or os.path.join('.cache', 'jobs.sqlite3')
+
+
+class JobStore:
+    """Job rows in a SQLite file: status, progress, partial and final responses as JSON."""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(_SCHEMA)
+
+    def _connect(self):
+        # One connection per call: safe across threads and forked workers
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def claim(self, key, owner):
+        """Take the job for `owner` unless another owner has it queued, running or done.
+
+        Failed jobs and running jobs without a heartbeat for STALE_SECONDS are claimed again.
+        """
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute('DELETE FROM jobs WHERE status IN (?, ?) AND updated < ?',
+                               ('done', 'failed', now - RESULT_TTL))
+            inserted = connection.execute(
+                'INSERT OR IGNORE INTO jobs (key, owner, status, progress, updated) VALUES (?, ?, ?, 0, ?)',
+                (key, owner, 'running', now)).rowcount
+            if inserted:
+                return True
+            return connection.execute(
+                "UPDATE jobs SET owner = ?, status = 'running', progress = 0, message = NULL, partial = NULL, "
+                "result = NULL, error = NULL, updated = ? "
+                "WHERE key = ? AND (status = 'failed' OR (status = 'running' AND updated < ?))",
+                (owner, now, key, now - STALE_SECONDS)).rowcount == 1
+
+    def update(self, key, owner, progress=None, message=None, partial=None):
+        with closing(self._connect()) as connection:
+            connection.execute(
+                'UPDATE jobs SET progress = COALESCE(?, progress), message = COALESCE(?, message), '
+                'partial = COALESCE(?, partial), updated = ? WHERE key = ? AND owner = ?',
+                (progress, message, None if partial is None else json.dumps(partial), time.time(), key, owner))
+
+    def heartbeat(self, key, owner):
+        with closing(self._connect()) as connection:
+            connection.execute("UPDATE jobs SET updated = ? WHERE key = ? AND owner = ? AND status = 'running'",
+                               (time.time(), key, owner))
+
+    def finish(self, key, owner, result=None, error=None):
+        with closing(self._connect()) as connection:
+            connection.execute(
+                'UPDATE jobs SET status = ?, progress = 1, partial = NULL, result = ?, error = ?, updated = ? '
+                'WHERE key = ? AND owner = ?',
+                ('failed' if error is not None else 'done', None if result is None else json.dumps(result),
+                 error, time.time(), key, owner))
+
+    def get(self, key):
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                'SELECT status, progress, message, partial, result, error FROM jobs WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        status, progress, message, partial, result, error = row
+        return {'status': status, 'progress': progress, 'message': message,
+                'partial': None if partial is None else json.loads(partial),
+                'result': None if result is None else json.loads(result), 'error': error}
+
+
+def report_progress(fraction=None, message=None, partial=None):
+    """Publish the progress of the job running on this thread (a no-op outside jobs).
+
+    `partial` is a Dash component shown under the progress bar until the job
+    finishes, e.g. the sections of an analysis that are already computed.
+    """
+    job = getattr(_current, 'job', None)
+    if job is None:
+        return
+    runner, key = job
+    if partial is not None and not isinstance(partial, dict):
+        from growth.figure_cache import to_payload
+
+        partial = to_payload(partial)
+    runner.store.update(key, runner.owner, fraction, message, partial)
+
+
+class JobRunner:
+    def __init__(self, store=None, max_workers=None):
+        if store is None:
+            try:
+                store = JobStore(store_path())
+            except (OSError, sqlite3.Error):
+                # Read-only hosts render every analysis in the request
+                store = None
+        self.store = store
+        self.max_workers = max_workers or int(os.environ.get(WORKERS_ENV, DEFAULT_WORKERS))
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._futures = {}
+
+    @property
+    def owner(self):
+        return str(os.getpid())
+
+    def _executor(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own pool
+        if self._pid != os.getpid():
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='wppool-job')
+            self._pid = os.getpid()
+            self._futures = {}
+        return self._pool
+
+    def _heartbeat(self, key, done):
+        while not done.wait(HEARTBEAT_SECONDS):
+            try:
+                self.store.heartbeat(key, self.owner)
+            except sqlite3.Error:
+                pass
+
+    def _run(self, key, func):
+        _current.job = (self, key)
+        done = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(key, done), daemon=True).start()
+        try:
+            result = func()
+            if not isinstance(result, dict):
+                from growth.figure_cache import to_payload
+
+                result = to_payload(result)
+            self.store.finish(key, self.owner, result=result)
+        except Exception as error:
+            self.store.finish(key, self.owner, error=f"{type(error).__name__}: {error}")
+        finally:
+            done.set()
+            _current.job = None
+            with self._lock:
+                self._futures.pop(key, None)
+
+    def submit(self, key, func, wait=INLINE_WAIT):
+        """Start `func` as job `key` unless it is already running somewhere; returns the job's
+        state after waiting up to `wait` seconds for it to finish."""
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None and self.store.claim(key, self.owner):
+                # A profiled request profiles the job thread, where the analysis runs
+                future = self._executor().submit(self._run, key, follow_profile(func))
+                self._futures[key] = future
+        if future is not None:
+            try:
+                future.result(timeout=wait)
+            except Exception:
+                pass
+        return self.store.get(key)
+
+
+def job_view(job):
+    """The response for a job's state and whether the page should stop polling."""
+    from dash import html
+
+    if job is not None and job['status'] == 'done':
+        return job['result'], True
+    if job is not None and job['status'] == 'failed':
+        return html.P(f"This analysis failed: {job['error']}", style={'textAlign': 'center'}), True
+    progress = (job or {}).get('progress')
+    children = [html.P((job or {}).get('message') or "Computing...", style={'textAlign': 'center'}),
+                html.Progress(value=progress or None, max=1,
+                              style={'display': 'block', 'width': '50%', 'margin': 'auto'})]
+    if job is not None and job['partial'] is not None:
+        children.append(job['partial'])
+    return html.Div(children), False
+
+
+def background_analyses(runner, render, analyses):
+    """Wrap `render(analysis, *inputs)` as a Dash callback `(analysis, *inputs, n_polls)` returning
+    (children, poll disabled), with `analyses` rendered as background jobs.
+
+    `render` is decorated with growth.figure_cache.cached_analysis. Cached
+    responses are returned without a job, and the cache key is the job key.
+    """
+    def show_analysis(analysis, *inputs):
+        inputs = inputs[:-1]
+        if analysis not in analyses or runner.store is None:
+            return render(analysis, *inputs), True
+        cached = render.cached(analysis, *inputs)
+        if cached is not None:
+            return cached, True
+        key = render.cache_key(analysis, *inputs)
+        return job_view(runner.submit(key, lambda: render(analysis, *inputs)))
+    return show_analysis
@@ -0,0 +1,294 @@
+# Live growth table with incremental upserts keyed on user_id
+#
+# New installs, upgrades and churn events arrive as small batches of rows. Each
+# batch is folded into the running aggregate cube by subtracting the replaced
+# rows' contribution and adding the new rows' contribution, so an update costs
+# O(batch) rather than a reload of the whole table. Every batch also produces a
+# new dataset version, which invalidates cached figures. When several worker
+# processes serve the same dataset, batches go through an append-only journal
+# that every worker replays in the same order.
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from growth.aggregates import TOP_N, AggregateCube, get_cube
+from growth.cohorts import get_cohorts
+from growth.filters import FilteredView, FilterIndex, filters_key
+from growth.loader import apply_schema
+from growth.segments import Segments, get_segment_model
+
+KEY = 'user_id'
+
+# Appended rows are buffered and concatenated onto the main frame in one go
+_MAX_PENDING_ROWS = 50000
+# Filtered views of the current version, shared by every analysis
+_MAX_CACHED_VIEWS = 8
+
+
+class IngestJournal:
+    """Append-only JSON-lines log of upserted batches shared by worker processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+
+    @contextmanager
+    def locked(self):
+        """Hold an exclusive lock on the journal; yields the file opened for appending."""
+        import fcntl
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def unread(self):
+        """Batches appended since the last call (complete lines only)."""
+        try:
+            if os.path.getsize(self.path) <= self.offset:
+                return []
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return []
+        data = data[:data.rfind(b'\n') + 1]
+        self.offset += len(data)
+        return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+    def append(self, f, rows):
+        f.write(json.dumps(rows, default=str).encode() + b'\n')
+        f.flush()
+        self.offset = f.tell()
+
+
+class LiveDataset:
+    def __init__(self, df, version=None, journal_dir=None):
+        self._frame = df.set_index(KEY, drop=False)
+        self._frame.index.name = None
+        self._pending = []
+        self._pending_ids = set()
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._index = None
+        self._views = {}
+        self._segments = None
+        self.cube = get_cube(df, version)
+        self._version = self.cube.version
+        self.base_version = self._version
+        # Batches logged by other processes serving the same base dataset
+        self.journal = None
+        if journal_dir:
+            self.journal = IngestJournal(os.path.join(journal_dir, f"ingest-{self.base_version}.jsonl"))
+            self.sync()
+
+    @property
+    def version(self):
+        self.sync()
+        return self._version
+
+    def sync(self):
+        """Apply batches that other processes logged to the journal since the last call."""
+        if self.journal is None:
+            return
+        with self._lock:
+            for rows in self.journal.unread():
+                self._apply(rows)
+
+    @property
+    def frame(self):
+        """The current user table, one row per user_id."""
+        with self._lock:
+            self._consolidate()
+            return self._frame
+
+    def view(self, filters=None):
+        """Return the FilteredView of the current table matching `filters` (see growth.filters).
+
+        The filter index is built the first time a filter is used after the
+        data changed; without filters the view is the live table and cube.
+        """
+        with self._lock:
+            self.sync()
+            frame = self.frame
+            if not filters:
+                return FilteredView(frame, self.cube)
+            key = filters_key(filters)
+            index = self.filter_index()
+            view = self._views.get(key)
+            if view is None:
+                view = index.view(frame, filters, self.cube, self._version)
+                self._views[key] = view
+                while len(self._views) > _MAX_CACHED_VIEWS:
+                    self._views.pop(next(iter(self._views)))
+            return view
+
+    def filter_index(self):
+        """The FilterIndex of the current version, built on first use."""
+        with self._lock:
+            if self._index is None or self._index[0] != self._version:
+                self._index = (self._version, FilterIndex(self.frame))
+                self._views = {}
+            return self._index[1]
+
+    def cohorts(self):
+        """The Cohorts of the current version (see growth.cohorts), built on first use."""
+        with self._lock:
+            self.sync()
+            return get_cohorts(self.frame, self._version)
+
+    def segments(self):
+        """Segment labels of the current table (see growth.segments), assigned on first use.
+
+        The model belongs to the dataset this table started from; upserts
+        assign only the rows they change.
+        """
+        with self._lock:
+            self.sync()
+            if self._segments is None:
+                self._segments = Segments.assign(get_segment_model(self.frame, self.base_version), self.frame)
+            return self._segments
+
+    def __len__(self):
+        return self.cube.n_rows
+
+    def on_change(self, listener):
+        """Call `listener(added, removed, version)` after every upsert.
+
+        `added` holds the new state of every touched user; `removed` holds the
+        replaced rows of users that already existed.
+        """
+        self._listeners.append(listener)
+        return listener
+
+    def _consolidate(self):
+        if self._pending:
+            self._frame = pd.concat([self._frame, *self._pending])
+            self._pending = []
+            self._pending_ids = set()
+
+    def _conform(self, rows):
+        # Incoming rows use the CSV's text formats; give them the table's dtypes
+        # and widen categoricals that meet a value for the first time
+        rows = apply_schema(rows.copy())
+        for column, dtype in self._frame.dtypes.items():
+            if column not in rows:
+                continue
+            if isinstance(dtype, pd.CategoricalDtype):
+                new_values = set(rows[column].dropna().unique()) - set(dtype.categories)
+                if new_values:
+                    self._frame[column] = self._frame[column].cat.add_categories(sorted(new_values))
+                    self._pending = [chunk.astype({column: self._frame[column].dtype}) for chunk in self._pending]
+                    dtype = self._frame[column].dtype
+                rows[column] = rows[column].astype(dtype)
+            elif rows[column].dtype != dtype and not rows[column].isna().any():
+                rows[column] = rows[column].astype(dtype)
+        return rows
+
+    def upsert(self, rows):
+        """Insert new users and update existing ones; returns (inserted, updated).
+
+        Rows for existing users may be partial: only the columns present and
+        non-null in `rows` replace the stored values. With a journal, `rows`
+        must be JSON records in the CSV's formats, as the ingest route receives.
+        """
+        if self.journal is None:
+            return self._apply(rows)
+        with self._lock, self.journal.locked() as f:
+            # Catch up first, so this batch lands after every batch logged before it
+            for logged in self.journal.unread():
+                self._apply(logged)
+            counts = self._apply(rows)
+            self.journal.append(f, rows)
+        return counts
+
+    def _apply(self, rows):
+        rows = pd.DataFrame(rows)
+        if KEY not in rows:
+            raise ValueError(f"Rows must include '{KEY}'")
+        rows = rows.drop_duplicates(subset=KEY, keep='last')
+        if rows.empty:
+            return 0, 0
+
+        with self._lock:
+            rows = self._conform(rows).set_index(KEY, drop=False)
+            rows.index.name = None
+            if self._pending_ids.intersection(rows.index):
+                self._consolidate()
+            exists = rows.index.isin(self._frame.index)
+
+            removed = self._frame.loc[rows.index[exists]]
+            updated = removed.copy()
+            updated.update(rows.loc[exists, [column for column in rows.columns if column in updated]])
+            # Columns missing from new users' rows come back as NaN: dates become NaT and
+            # categoricals stay categorical; only integers with gaps cannot keep their dtype
+            inserted = rows.loc[~exists].reindex(columns=self._frame.columns)
+            inserted = inserted.astype({column: dtype for column, dtype in self._frame.dtypes.items()
+                                        if not (pd.api.types.is_integer_dtype(dtype)
+                                                and inserted[column].isna().any())})
+            added = pd.concat([updated, inserted]) if len(updated) else inserted
+
+            if self._segments is not None:
+                # Labels follow row positions: updated rows stay put, inserted rows are appended
+                positions = self._frame.index.get_indexer(updated.index)
+                self._segments = self._segments.update(positions, updated, removed, inserted)
+
+            cube = self.cube
+            if len(removed):
+                cube = cube.subtract(AggregateCube.from_frame(removed))
+                self._frame.loc[updated.index, updated.columns] = updated
+            if len(inserted):
+                self._pending.append(inserted)
+                self._pending_ids.update(inserted.index)
+            cube = cube.merge(AggregateCube.from_frame(added))
+            if cube.top_users['user_id'].isin(removed.index).any():
+                # A previous top user changed and may have dropped out of the top
+                cube.top_users = self.frame.nlargest(TOP_N, 'total_sessions')[cube.top_users.columns]
+
+            digest = hashlib.sha1(self._version.encode())
+            digest.update(pd.util.hash_pandas_object(added, index=False).to_numpy().tobytes())
+            cube.version = digest.hexdigest()[:16]
+            self.cube = cube
+            self._version = cube.version
+            if sum(len(chunk) for chunk in self._pending) > _MAX_PENDING_ROWS:
+                self._consolidate()
+
+        for listener in self._listeners:
+            listener(added, removed, self._version)
+        return len(inserted), len(updated)
+
+
+def register_ingest_route(server, dataset, token=None, path='/api/users'):
+    """Expose `dataset.upsert` as a JSON POST endpoint on the Flask server.
+
+    The body is a list of user rows (or {"rows": [...]}) using the CSV's column
+    names, and requests must send "Authorization: Bearer <token>". Without a
+    `token` the route is not registered, so the data cannot be written to.
+    """
+    from flask import jsonify, request
+
+    if not token:
+        return server
+
+    def ingest_users():
+        if request.headers.get('Authorization') != f"Bearer {token}":
+            return jsonify({'error': 'unauthorized'}), 401
+        body = request.get_json(silent=True)
+        rows = body.get('rows') if isinstance(body, dict) else body
+        if not isinstance(rows, list):
+            return jsonify({'error': 'expected a JSON list of rows'}), 400
+        try:
+            inserted, updated = dataset.upsert(rows)
+        except (ValueError, TypeError, KeyError) as error:
+            return jsonify({'error': str(error)}), 400
+        return jsonify({'inserted': inserted, 'updated': updated, 'version': dataset.version})
+
+    server.add_url_rule(path, 'ingest_users', ingest_users, methods=['POST'])
+    return server
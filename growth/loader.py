@@ -0,0 +1,124 @@
+# Typed columnar loader for the growth export
+#
+# The CSV is parsed once into categoricals, int8 flags and real dates and written
+# as an uncompressed Arrow (Feather v2) file next to it. Later starts memory-map
+# that file instead of parsing text. The cache is keyed by the CSV's SHA-256, so
+# editing or replacing the export invalidates it automatically.
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CATEGORICAL_COLUMNS = ['country', 'subscription_type', 'plan_type']
+FLAG_COLUMNS = ['churned', 'activation_status', 'download_clicks']
+DATE_COLUMNS = ['install_date', 'last_active_date', 'pro_upgrade_date']
+DATE_FORMAT = '%m/%d/%Y'
+
+# Serverless hosts only allow writes under /tmp, so the cache location can be moved
+CACHE_DIR_ENV = 'WPPOOL_CACHE_DIR'
+# Directory the dashboards read their CSV from (default: the working directory)
+DATA_DIR_ENV = 'WPPOOL_DATA_DIR'
+_HASH_BLOCK_SIZE = 1 << 20
+
+
+def data_path(name):
+    """`name` in WPPOOL_DATA_DIR when it is set, otherwise relative to the working directory."""
+    return os.path.join(os.environ.get(DATA_DIR_ENV, ''), name)
+
+
+def cache_dir(csv_path):
+    return os.environ.get(CACHE_DIR_ENV) or os.path.join(os.path.dirname(os.path.abspath(csv_path)), '.cache')
+
+
+def file_hash(csv_path):
+    """SHA-256 of the CSV, reusing the last digest while size and mtime are unchanged."""
+    stat = os.stat(csv_path)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    sidecar = os.path.join(cache_dir(csv_path), f"{stem}.hash.json")
+    try:
+        with open(sidecar) as f:
+            known = json.load(f)
+        if known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    sha256 = digest.hexdigest()
+    try:
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        with open(sidecar, 'w') as f:
+            json.dump({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}, f)
+    except OSError:
+        pass
+    return sha256
+
+
+def apply_schema(df):
+    """Convert a raw growth frame to categoricals, compact integers and dates."""
+    for column in CATEGORICAL_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype('category')
+    for column in DATE_COLUMNS:
+        if column in df:
+            df[column] = pd.to_datetime(df[column], format=DATE_FORMAT)
+    for column in df.select_dtypes(include='integer').columns:
+        target = 'int8' if column in FLAG_COLUMNS else 'int32'
+        info = np.iinfo(target)
+        if df[column].empty or (df[column].min() >= info.min and df[column].max() <= info.max):
+            df[column] = df[column].astype(target)
+    return df
+
+
+def read_typed_csv(csv_path, **kwargs):
+    return apply_schema(pd.read_csv(csv_path, **kwargs))
+
+
+def cache_path(csv_path):
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir(csv_path), f"{stem}.{file_hash(csv_path)[:16]}.arrow")
+
+
+def load_growth_data(csv_path, use_cache=True):
+    """Load the growth export as a typed DataFrame, via the Arrow cache when possible."""
+    try:
+        from pyarrow import feather
+    except ImportError:
+        return read_typed_csv(csv_path)
+    if not use_cache:
+        return read_typed_csv(csv_path)
+
+    path = cache_path(csv_path)
+    if os.path.exists(path):
+        return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True)
+
+    df = read_typed_csv(csv_path)
+    try:
+        write_cache(df, path)
+    except OSError:
+        pass
+    return df
+
+
+def write_cache(df, path):
+    """Atomically write `df` to `path` and drop caches of older CSV versions."""
+    from pyarrow import feather
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(df.reset_index(drop=True), tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+
+    stem = os.path.basename(path).split('.')[0]
+    for name in os.listdir(directory):
+        if name.startswith(stem + '.') and name.endswith('.arrow') and os.path.join(directory, name) != path:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
@@ -0,0 +1,256 @@
+# Per-analysis callback instrumentation exposed in Prometheus text format
+#
+# For every analysis value the dashboard records end-to-end latency, the time
+# split between pandas compute, Plotly figure building and serialization, the
+# response payload size and figure-cache hits/misses. Branches mark their figure
+# building with `with phase('figure'):`; the rest of the callback counts as
+# compute. A sampling profiler can be switched on for individual requests.
+import collections
+import functools
+import itertools
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7)
+
+PROFILING_ENV = 'WPPOOL_PROFILING'
+PROFILE_INTERVAL = 0.005
+MAX_PROFILES = 20
+
+_state = threading.local()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        rendered = []
+        for bound, count in zip(self.buckets, self.counts):
+            rendered.append(f"{name}_bucket{_labels(labels, le=_number(bound))} {count}")
+        rendered.append(f"{name}_bucket{_labels(labels, le='+Inf')} {self.count}")
+        rendered.append(f"{name}_sum{_labels(labels)} {_number(self.total)}")
+        rendered.append(f"{name}_count{_labels(labels)} {self.count}")
+        return rendered
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _labels(labels, **extra):
+    merged = dict(labels, **extra)
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in merged.items()) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class CallbackMetrics:
+    def __init__(self, namespace='wppool'):
+        self.namespace = namespace
+        self.latency = collections.defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.phases = collections.defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.payload_bytes = collections.defaultdict(lambda: Histogram(BYTES_BUCKETS))
+        self.cache_requests = collections.Counter()
+        # Seconds spent in each step of starting the app, in order
+        self.startup = {}
+        self._lock = threading.Lock()
+
+    def observe(self, analysis, latency, cache_hit, timings=None, payload_bytes=None):
+        analysis = str(analysis)
+        with self._lock:
+            self.latency[analysis].observe(latency)
+            self.cache_requests[(analysis, 'hit' if cache_hit else 'miss')] += 1
+            for phase_name, seconds in (timings or {}).items():
+                self.phases[(analysis, phase_name)].observe(seconds)
+            if payload_bytes is not None:
+                self.payload_bytes[analysis].observe(payload_bytes)
+
+    def record_startup(self, step, seconds):
+        with self._lock:
+            self.startup[step] = seconds
+
+    def render(self):
+        name = self.namespace
+        lines = []
+        with self._lock:
+            if self.startup:
+                lines += [f"# HELP {name}_startup_seconds Time spent in each step of starting the app.",
+                          f"# TYPE {name}_startup_seconds gauge"]
+                for step, seconds in self.startup.items():
+                    lines.append(f"{name}_startup_seconds{_labels({'step': step})} {_number(seconds)}")
+            lines += [f"# HELP {name}_callback_latency_seconds Dashboard callback latency by analysis.",
+                      f"# TYPE {name}_callback_latency_seconds histogram"]
+            for analysis, histogram in sorted(self.latency.items()):
+                lines += histogram.lines(f"{name}_callback_latency_seconds", {'analysis': analysis})
+            lines += [f"# HELP {name}_callback_phase_seconds Time spent in compute, figure building and serialization.",
+                      f"# TYPE {name}_callback_phase_seconds histogram"]
+            for (analysis, phase_name), histogram in sorted(self.phases.items()):
+                lines += histogram.lines(f"{name}_callback_phase_seconds", {'analysis': analysis, 'phase': phase_name})
+            lines += [f"# HELP {name}_response_bytes Serialized callback response size.",
+                      f"# TYPE {name}_response_bytes histogram"]
+            for analysis, histogram in sorted(self.payload_bytes.items()):
+                lines += histogram.lines(f"{name}_response_bytes", {'analysis': analysis})
+            lines += [f"# HELP {name}_figure_cache_requests_total Figure cache lookups by analysis and result.",
+                      f"# TYPE {name}_figure_cache_requests_total counter"]
+            for (analysis, result), count in sorted(self.cache_requests.items()):
+                lines.append(f"{name}_figure_cache_requests_total{_labels({'analysis': analysis, 'result': result})} {count}")
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def phase(name):
+    """Attribute the enclosed time to `name` for the callback running on this thread."""
+    timings = getattr(_state, 'timings', None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def collect_phases():
+    """Collect phase() timings made on this thread; yields the timings dict."""
+    previous = getattr(_state, 'timings', None)
+    _state.timings = {}
+    try:
+        yield _state.timings
+    finally:
+        _state.timings = previous
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval from a background thread.
+
+    Results are collapsed stacks ("outer;inner count" lines), the input format
+    of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+def follow_profile(func):
+    """Wrap `func`, to be run by another thread on behalf of the current request.
+
+    If the request is being profiled, the thread running `func` is sampled too
+    and its samples are kept as a separate profile that names the request's.
+    """
+    record = getattr(_state, 'record_profile', None)
+    if record is None:
+        return func
+
+    @functools.wraps(func)
+    def profiled(*args, **kwargs):
+        profiler = SamplingProfiler(threading.get_ident()).start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(profiler.stop())
+    return profiled
+
+
+def register_metrics_routes(server, metrics, path='/metrics'):
+    """Serve `metrics` at `path` and, with WPPOOL_PROFILING=1, per-request profiles.
+
+    A callback request is profiled when it carries an "X-Profile: 1" header or
+    a "wppool_profile=1" cookie. Work it hands to another thread through
+    `follow_profile` (a background job) is profiled separately, with the
+    request's profile id as its `request`. The last few profiles are listed at
+    `<path>/profiles` and served as collapsed stacks at `<path>/profiles/<n>`.
+    """
+    from flask import Response, g, jsonify, request
+
+    profiles = collections.deque(maxlen=MAX_PROFILES)
+    profile_ids = itertools.count(1)
+
+    def serve_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    server.add_url_rule(path, 'metrics', serve_metrics)
+    if os.environ.get(PROFILING_ENV) != '1':
+        return server
+
+    def add_profile(profile_id, inputs, profiler, request_id=None):
+        profiles.append({'id': profile_id, 'inputs': inputs, 'request': request_id,
+                         'samples': sum(profiler.samples.values()), 'collapsed': profiler.collapsed()})
+
+    @server.before_request
+    def start_profiler():
+        _state.record_profile = None
+        wanted = request.headers.get('X-Profile') == '1' or request.cookies.get('wppool_profile') == '1'
+        if wanted and request.path.endswith('/_dash-update-component'):
+            body = request.get_json(silent=True) or {}
+            inputs = [item.get('value') for item in body.get('inputs', []) if isinstance(item, dict)]
+            request_id = next(profile_ids)
+            g.wppool_profile = (request_id, inputs)
+            g.wppool_profiler = SamplingProfiler(threading.get_ident()).start()
+            _state.record_profile = lambda profiler: add_profile(next(profile_ids), inputs, profiler, request_id)
+
+    @server.after_request
+    def stop_profiler(response):
+        _state.record_profile = None
+        profiler = g.pop('wppool_profiler', None)
+        if profiler is not None:
+            profile_id, inputs = g.pop('wppool_profile')
+            add_profile(profile_id, inputs, profiler.stop())
+            response.headers['X-Profile-Id'] = str(profile_id)
+        return response
+
+    def list_profiles():
+        return jsonify([{key: value for key, value in profile.items() if key != 'collapsed'} for profile in profiles])
+
+    def show_profile(profile_id):
+        for profile in profiles:
+            if profile['id'] == profile_id:
+                return Response(profile['collapsed'] + '\n', mimetype='text/plain')
+        return Response('unknown profile\n', status=404, mimetype='text/plain')
+
+    server.add_url_rule(f"{path}/profiles", 'metrics_profiles', list_profiles)
+    server.add_url_rule(f"{path}/profiles/<int:profile_id>", 'metrics_profile', show_profile)
+    return server
@@ -0,0 +1,327 @@
+# Static HTML report (the dashboard shipped as a single page), built incrementally
+#
+#   python -m growth.report data/wppool_growth_data_sample_20k.csv -o index.html
+#
+# Each section is rendered from the aggregate cube in a process pool and cached
+# as an HTML fragment keyed on the dataset version and the section's code, so a
+# rebuild only re-renders sections whose data or code changed. Figures are
+# embedded as compact JSON without plotly's default template, which is written
+# once per page along with a single plotly.js script.
+import argparse
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import growth.aggregates
+import growth.cohorts
+from growth.aggregates import get_cube
+from growth.cleaning import clean_growth_data
+from growth.cohorts import get_cohorts
+from growth.loader import load_growth_data
+
+TITLE = 'WPPOOL Growth Analytics Dashboard'
+PLOTLYJS_MODES = ('cdn', 'file', 'inline')
+MANIFEST_NAME = 'manifest.json'
+
+
+# Sections, in page order. Each returns a list of HTML strings and Plotly figures.
+
+def exploration(data):
+    cube = data['cube']
+    distribution = cube.rollup('subscription_type', stat='count') / cube.n_rows * 100
+    return ["<h1>Data Exploration & Cleaning</h1>",
+            f"<p>Total Users: {cube.n_rows}</p>",
+            f"<p>Free Users: {distribution.get('Free', 0):.2f}%</p>",
+            f"<p>Pro Users: {distribution.get('Pro', 0):.2f}%</p>",
+            f"<p>{data['duplicates_removed']} duplicates were removed.</p>"]
+
+
+def engagement(data):
+    import plotly.express as px
+
+    cube = data['cube']
+    avg_sessions = cube.rollup('subscription_type', 'total_sessions', stat='mean')
+    top_countries = cube.rollup('country', 'total_sessions').nlargest(5)
+    return ["<h1>User Engagement Analysis</h1>",
+            "<h2>Average Sessions for Free vs. Pro Users</h2>",
+            px.bar(avg_sessions, x=avg_sessions.index, y=avg_sessions.values,
+                   labels={'x': 'Subscription Type', 'y': 'Average Sessions'},
+                   title='Average Sessions by Subscription Type'),
+            "<h2>Top 5 Most Active Users</h2>",
+            _table(cube.top_users, ["User ID", "Total Sessions", "Subscription Type"]),
+            "<h2>Top 5 Countries with Highest Engagement</h2>",
+            px.bar(top_countries, x=top_countries.index, y=top_countries.values,
+                   labels={'x': 'Country', 'y': 'Total Sessions'},
+                   title='Top 5 Countries by Engagement')]
+
+
+def churn(data):
+    import plotly.express as px
+
+    cube = data['cube']
+    churn_rate = cube.share('subscription_type', where={'churned': 1}) * 100
+    churn_trends = cube.rollup(['subscription_type', 'churned'], stat='count').unstack()
+    return ["<h1>Churn Analysis</h1>",
+            "<h2>Churn Rate by Subscription Type</h2>",
+            px.pie(churn_rate, values=churn_rate.values, names=churn_rate.index,
+                   title='Churn Rate by Subscription Type', hole=0.4),
+            "<h2>Churn Trends: Free vs. Pro Users</h2>",
+            px.bar(churn_trends, barmode='group',
+                   labels={'value': 'Number of Users', 'subscription_type': 'Subscription Type'},
+                   title='Churn Trends: Free vs. Pro Users')]
+
+
+def revenue(data):
+    import plotly.express as px
+
+    cube = data['cube']
+    pro = {'subscription_type': 'Pro'}
+    upgrade_percentage = cube.rollup(stat='count', where=pro) / cube.n_rows * 100
+    total_revenue = cube.rollup(measure='monthly_revenue', where=pro)
+    revenue_by_plan = cube.rollup('plan_type', 'monthly_revenue', where=pro)
+    upgrade_time = data['cohorts'].mean_upgrade_time()
+    return ["<h1>Revenue & Upgrade Trends</h1>",
+            "<h2>Percentage of Users Upgraded from Free to Pro</h2>",
+            f"<p>{upgrade_percentage:.2f}%</p>",
+            "<h2>Total Monthly Revenue from Pro Users</h2>",
+            f"<p>${total_revenue:,.2f}</p>",
+            "<h2>Revenue Contribution by Pro Plan</h2>",
+            px.pie(revenue_by_plan, values=revenue_by_plan.values, names=revenue_by_plan.index,
+                   title='Revenue by Pro Plan', hole=0.4),
+            "<h2>Average Time to Upgrade (Days)</h2>",
+            f"<p>{upgrade_time:.2f} days</p>"]
+
+
+def market(data):
+    import plotly.express as px
+
+    revenue_by_country = data['cube'].rollup('country', 'monthly_revenue').reset_index()
+    return ["<h1>Market Expansion Opportunities</h1>",
+            "<h2>Total Revenue by Country</h2>",
+            px.choropleth(revenue_by_country, locations='country', locationmode='country names',
+                          color='monthly_revenue', hover_name='country',
+                          title='Total Revenue by Country',
+                          color_continuous_scale=px.colors.sequential.Plasma)]
+
+
+def comparison(data):
+    import pandas as pd
+    import plotly.express as px
+
+    sessions_by_country = data['cube'].rollup('country', 'total_sessions')
+    high_engagement = sessions_by_country.nlargest(5).reset_index()
+    underpenetrated = sessions_by_country.nsmallest(5).reset_index()
+    high_engagement['market_type'] = 'High Engagement'
+    underpenetrated['market_type'] = 'Underpenetrated'
+    combined_data = pd.concat([high_engagement, underpenetrated])
+    return ["<h1>High-Engagement vs. Underpenetrated Markets</h1>",
+            px.bar(combined_data, x='country', y='total_sessions', color='market_type',
+                   labels={'x': 'Country', 'y': 'Total Sessions'},
+                   title='High-Engagement vs. Underpenetrated Markets')]
+
+
+SECTIONS = [exploration, engagement, churn, revenue, market, comparison]
+
+
+def _table(df, headers):
+    from html import escape
+
+    head = ''.join(f"<th>{escape(header)}</th>" for header in headers)
+    rows = ''.join('<tr>' + ''.join(f"<td>{escape(str(value))}</td>" for value in row) + '</tr>'
+                   for row in df.itertuples(index=False))
+    return f'<table class="report-table"><thead><tr>{head}</tr></thead><tbody>{rows}</tbody></table>'
+
+
+def _default_template():
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    # As serialized into a figure's layout, so it compares equal to the copies there
+    return json.loads(pio.to_json(go.Figure(), validate=False))['layout']['template']
+
+
+def _figure_json(fig, template):
+    import plotly.io as pio
+
+    spec = json.loads(pio.to_json(fig, validate=False, remove_uids=True))
+    if spec.get('layout', {}).get('template') == template:
+        # Restored from the page-wide copy by the loader script
+        del spec['layout']['template']
+        spec['defaultTemplate'] = True
+    # '<' only occurs inside JSON strings, where the escape keeps </script> out of the page
+    return json.dumps(spec, separators=(',', ':')).replace('<', '\\u003c')
+
+
+def render_section(name, data):
+    """Render one section to an HTML fragment (runs in a pool worker)."""
+    section = next(section for section in SECTIONS if section.__name__ == name)
+    template = _default_template()
+    parts = []
+    for number, part in enumerate(section(data)):
+        if isinstance(part, str):
+            parts.append(part)
+            continue
+        figure_id = f"figure-{name}-{number}"
+        parts.append(f'<div id="{figure_id}" class="report-figure"></div>'
+                     f'<script type="application/json" data-figure="{figure_id}">{_figure_json(part, template)}</script>')
+    return '\n'.join(parts)
+
+
+def _render_timed(name, data):
+    """render_section and the seconds it took, measured in the worker that ran it."""
+    start = time.perf_counter()
+    fragment = render_section(name, data)
+    return fragment, time.perf_counter() - start
+
+
+def section_key(section, fingerprint):
+    """Cache key of a section: the data it is rendered from plus the code that renders it."""
+    import plotly
+
+    shared = [inspect.getsource(growth.aggregates), inspect.getsource(growth.cohorts),
+              inspect.getsource(render_section),
+              inspect.getsource(_figure_json), inspect.getsource(_table)]
+    raw = json.dumps([fingerprint, plotly.__version__, inspect.getsource(section), shared])
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+
+_LOADER = """<script>
+(function () {
+  var template = JSON.parse(document.getElementById('plotly-template').textContent);
+  document.querySelectorAll('script[data-figure]').forEach(function (spec) {
+    var figure = JSON.parse(spec.textContent);
+    if (figure.defaultTemplate) figure.layout.template = template;
+    Plotly.newPlot(spec.dataset.figure, figure.data, figure.layout, {responsive: true});
+  });
+})();
+</script>"""
+
+
+def _plotlyjs_tag(mode, output_dir):
+    from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+    if mode == 'cdn':
+        return f'<script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js" charset="utf-8"></script>'
+    if mode == 'inline':
+        return f'<script type="text/javascript">{get_plotlyjs()}</script>'
+    name = f"plotly-{get_plotlyjs_version()}.min.js"
+    path = os.path.join(output_dir, name)
+    if not os.path.exists(path):
+        _write_atomic(path, get_plotlyjs().encode())
+    return f'<script src="{name}" charset="utf-8"></script>'
+
+
+def _page(fragments, plotlyjs_tag, template):
+    template_json = json.dumps(template, separators=(',', ':')).replace('<', '\\u003c')
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{TITLE}</title>
+    {plotlyjs_tag}
+</head>
+<body>
+    <h1 style="text-align: center; color: #2c3e50;">{TITLE}</h1>
+{chr(10).join(fragments)}
+<script type="application/json" id="plotly-template">{template_json}</script>
+{_LOADER}
+</body>
+</html>
+"""
+
+
+def _write_atomic(path, content):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def build_report(csv_path, output='index.html', cache_dir=None, workers=None, force=False,
+                 plotlyjs='cdn', compress=False):
+    """Build the static report; returns {section: 'cached' | seconds to render}."""
+    if plotlyjs not in PLOTLYJS_MODES:
+        raise ValueError(f"Unknown plotly.js mode: {plotlyjs}")
+    output_dir = os.path.dirname(os.path.abspath(output))
+    cache_dir = cache_dir or os.path.join(output_dir, '.cache', 'report')
+    os.makedirs(cache_dir, exist_ok=True)
+
+    df, duplicates_removed = clean_growth_data(load_growth_data(csv_path))
+    cube = get_cube(df)
+    data = {'cube': cube, 'cohorts': get_cohorts(df, cube.version), 'duplicates_removed': duplicates_removed}
+    fingerprint = [cube.version, duplicates_removed]
+
+    manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    keys = {section.__name__: section_key(section, fingerprint) for section in SECTIONS}
+    stale = [name for name, key in keys.items()
+             if force or manifest.get(name) != key
+             or not os.path.exists(os.path.join(cache_dir, f"{name}-{key}.html"))]
+
+    results = {name: 'cached' for name in keys if name not in stale}
+    if stale:
+        if len(stale) == 1 or workers == 1:
+            rendered = [_render_timed(name, data) for name in stale]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(stale))) as pool:
+                rendered = list(pool.map(_render_timed, stale, [data] * len(stale)))
+        for name, (fragment, elapsed) in zip(stale, rendered):
+            old_key = manifest.get(name)
+            _write_atomic(os.path.join(cache_dir, f"{name}-{keys[name]}.html"), fragment.encode())
+            if old_key and old_key != keys[name]:
+                try:
+                    os.remove(os.path.join(cache_dir, f"{name}-{old_key}.html"))
+                except OSError:
+                    pass
+            manifest[name] = keys[name]
+            results[name] = elapsed
+        _write_atomic(manifest_path, json.dumps(manifest, indent=1).encode())
+
+    fragments = []
+    for name in keys:
+        with open(os.path.join(cache_dir, f"{name}-{keys[name]}.html")) as f:
+            fragments.append(f.read())
+    page = _page(fragments, _plotlyjs_tag(plotlyjs, output_dir), _default_template()).encode()
+    try:
+        with open(output, 'rb') as f:
+            unchanged = f.read() == page
+    except OSError:
+        unchanged = False
+    if not unchanged:
+        _write_atomic(output, page)
+    if compress and (not unchanged or not os.path.exists(output + '.gz')):
+        _write_atomic(output + '.gz', gzip.compress(page, compresslevel=9, mtime=0))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the static growth dashboard.')
+    parser.add_argument('csv', nargs='?', default='data/wppool_growth_data_sample_20k.csv')
+    parser.add_argument('-o', '--output', default='index.html')
+    parser.add_argument('--cache-dir', help='section cache (default: .cache/report next to the output)')
+    parser.add_argument('--workers', type=int, help='render processes (default: one per CPU)')
+    parser.add_argument('--force', action='store_true', help='re-render every section')
+    parser.add_argument('--plotlyjs', choices=PLOTLYJS_MODES, default='cdn',
+                        help='load plotly.js from the CDN, a file next to the page, or inline')
+    parser.add_argument('--gzip', action='store_true', help='also write a gzip-compressed copy of the page')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = build_report(args.csv, args.output, args.cache_dir, args.workers, args.force,
+                           args.plotlyjs, args.gzip)
+    rendered = [name for name, result in results.items() if result != 'cached']
+    print(f"Wrote {args.output} in {time.perf_counter() - start:.2f}s "
+          f"({len(rendered)} of {len(results)} sections rendered: {', '.join(rendered) or 'none'})")
+
+
+if __name__ == '__main__':
+    main()
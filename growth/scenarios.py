@@ -0,0 +1,187 @@
+# What-if growth scenarios (Task_7's strategies) simulated in batches
+#
+# Users are reduced once to strata: (plan, subscription, activated, clicked a
+# download) with a user count and a churned count each. The source table is
+# only read. An intervention moves users between strata or changes their churn,
+# and the number of users affected in a stratum is a binomial (or
+# hypergeometric) draw. Every draw is broadcast over (scenario, replicate,
+# stratum), so a grid of hundreds of scenarios with hundreds of replicates is a
+# few array operations rather than one pass over the users per scenario.
+import itertools
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Task_7 assumes a 12-month customer lifespan. Here that is the lifespan at the
+# current Pro churn rate, and it scales with 1 / churn (a constant monthly hazard)
+LIFESPAN_MONTHS = 12
+N_REPLICATES = 200
+# Plan label of users without a plan (Free users)
+NO_PLAN = 'Free'
+
+# Task_7's strategies: onboarding activates 80% of inactive users, and
+# upselling converts 7% of the Free users who clicked a download
+STRATEGIES = {
+    'Current': {},
+    'Onboarding': {'activation': 0.8},
+    'Upselling': {'upsell': 0.07},
+    'Retention (10% fewer churners)': {'churn_reduction': 0.1},
+    'Combined': {'activation': 0.8, 'upsell': 0.07, 'churn_reduction': 0.1},
+}
+# Levels swept by the dashboard (11 x 5 x 7 = 385 scenarios)
+SWEEP = {'activation': np.linspace(0, 1, 11).round(2),
+         'upsell': [0.0, 0.035, 0.07, 0.105, 0.14],
+         'churn_reduction': np.linspace(0, 0.3, 7).round(2)}
+
+
+class ScenarioModel:
+    def __init__(self, strata, plans, revenue_mean, revenue_std, pro_revenue):
+        # strata: one row per (plan, pro, activated, download) with 'users' and 'churned' counts
+        self.strata = strata
+        self.plans = plans
+        self.revenue_mean = revenue_mean
+        self.revenue_std = revenue_std
+        self.pro_revenue = pro_revenue
+        self.n_users = int(strata['users'].sum())
+
+        users = strata['users'].to_numpy(dtype=np.int64)
+        activated = strata['activated'].to_numpy(dtype=bool)
+        # The activated stratum an inactive user moves to, and that stratum's churn rate
+        position = {key: number for number, key in
+                    enumerate(zip(strata['plan'], strata['pro'], strata['activated'], strata['download']))}
+        self._counterpart = np.array([position.get((plan, pro, True, download), -1) for plan, pro, download
+                                      in zip(strata['plan'], strata['pro'], strata['download'])])
+        churn = strata['churned'].to_numpy(dtype='float64') / np.maximum(users, 1)
+        active_rate = strata.loc[activated, 'churned'].sum() / max(strata.loc[activated, 'users'].sum(), 1)
+        self._activated_churn = np.where(self._counterpart >= 0, churn[np.maximum(self._counterpart, 0)], active_rate)
+
+    @classmethod
+    def from_frame(cls, df):
+        plans = df['plan_type'].astype(object).where(df['plan_type'].notna(), NO_PLAN)
+        keys = pd.DataFrame({'plan': plans.to_numpy(),
+                             'pro': df['subscription_type'].eq('Pro').to_numpy(),
+                             'activated': df['activation_status'].fillna(0).to_numpy() == 1,
+                             'download': df['download_clicks'].fillna(0).to_numpy() == 1,
+                             'churned': df['churned'].fillna(0).to_numpy() == 1})
+        grouped = keys.groupby(['plan', 'pro', 'activated', 'download'], sort=True)
+        strata = pd.DataFrame({'users': grouped.size(), 'churned': grouped['churned'].sum()})
+        # Every stratum's activated counterpart exists, so onboarding has somewhere to move users to
+        full = pd.MultiIndex.from_tuples(
+            sorted({(plan, pro, activated, download) for plan, pro, _, download in strata.index
+                    for activated in (False, True)}), names=strata.index.names)
+        strata = strata.reindex(full, fill_value=0).reset_index()
+        revenue = df.loc[df['subscription_type'].eq('Pro').to_numpy(), 'monthly_revenue'].astype('float64')
+        return cls(strata, sorted(set(strata['plan'])), revenue.mean() if len(revenue) else 0.0,
+                   revenue.std(ddof=0) if len(revenue) else 0.0, revenue.sum())
+
+    def baseline(self):
+        """The current KPIs (Task_7's churn rate, Free -> Pro conversion and CLV)."""
+        return {kpi: values[0, 0] for kpi, values in self.simulate(scenario_grid(), 1).items()}
+
+    def simulate(self, scenarios, n_replicates=N_REPLICATES, seed=0):
+        """KPI arrays of shape (scenario, replicate) for each row of `scenarios` (see `scenario_grid`).
+
+        `activation` is the chance an inactive user is activated by onboarding;
+        activated users take the churn rate of activated users like them.
+        `upsell` is the chance a Free user who clicked a download upgrades to Pro.
+        `churn_reduction_<plan>` is the chance a churning user of that plan is
+        retained, `churn_reduction` the same for plans without their own column.
+        """
+        rng = np.random.default_rng(seed)
+        strata = self.strata
+        shape = (len(scenarios), n_replicates, len(strata))
+        users = np.broadcast_to(strata['users'].to_numpy(dtype=np.int64), shape)
+        churned = np.broadcast_to(strata['churned'].to_numpy(dtype=np.int64), shape)
+        inactive = ~strata['activated'].to_numpy(dtype=bool)
+        pro = strata['pro'].to_numpy(dtype=bool)
+
+        def levels(column, default=None):
+            values = scenarios[column] if column in scenarios else scenarios.get(default, 0.0)
+            return np.broadcast_to(np.asarray(values, dtype='float64'), (len(scenarios),))
+
+        def per_scenario(column):
+            return levels(column)[:, None, None]
+
+        # Onboarding: move activated users to their activated stratum with a fresh churn outcome
+        moved = rng.binomial(users, per_scenario('activation') * inactive)
+        moved_churned_before = rng.hypergeometric(churned, users - churned, moved)
+        moved_churned_after = rng.binomial(moved, np.broadcast_to(self._activated_churn, shape))
+        users = users - moved
+        churned = churned - moved_churned_before
+        targets = self._counterpart[inactive]
+        users[..., targets] += moved[..., inactive]
+        churned[..., targets] += moved_churned_after[..., inactive]
+
+        # Retention: each churning user of a plan is kept with that plan's reduction
+        plan_codes = strata['plan'].map({plan: number for number, plan in enumerate(self.plans)}).to_numpy()
+        reductions = np.stack([levels(f"churn_reduction_{plan}", 'churn_reduction') for plan in self.plans], axis=1)
+        churned = churned - rng.binomial(churned, reductions[:, plan_codes][:, None, :])
+
+        # Upselling: Free users who clicked a download upgrade, taking their churn outcome with them
+        eligible = ~pro & strata['download'].to_numpy(dtype=bool)
+        upgraded = rng.binomial(users, per_scenario('upsell') * eligible)
+        upgraded_churned = rng.hypergeometric(churned, users - churned, upgraded)
+
+        n_upgraded = upgraded.sum(axis=2)
+        pro_users = users[..., pro].sum(axis=2) + n_upgraded
+        pro_churned = churned[..., pro].sum(axis=2) + upgraded_churned.sum(axis=2)
+        # New Pro users' revenue: sum of that many draws from the Pro revenue distribution (normal approximation)
+        new_revenue = np.maximum(n_upgraded * self.revenue_mean
+                                 + np.sqrt(n_upgraded) * self.revenue_std * rng.standard_normal(n_upgraded.shape), 0)
+        revenue = self.pro_revenue + new_revenue
+
+        base_churn = self.strata.loc[pro, 'churned'].sum() / max(self.strata.loc[pro, 'users'].sum(), 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pro_churn = pro_churned / pro_users
+            lifespan = np.where(pro_churn > 0, LIFESPAN_MONTHS * base_churn / pro_churn, np.nan)
+            clv = revenue / pro_users * lifespan
+        n = max(self.n_users, 1)
+        return {'churn_rate': churned.sum(axis=2) / n * 100,
+                'activation_rate': users[..., ~inactive].sum(axis=2) / n * 100,
+                'conversion_rate': pro_users / n * 100,
+                'monthly_revenue': revenue,
+                'clv': clv}
+
+
+def scenario_grid(activation=(0.0,), upsell=(0.0,), churn_reduction=(0.0,)):
+    """Every combination of the intervention levels, one scenario per row.
+
+    `churn_reduction` is a list of levels applied to every plan, or a
+    {plan: levels} dict to vary plans independently.
+    """
+    if isinstance(churn_reduction, dict):
+        names = [f"churn_reduction_{plan}" for plan in churn_reduction]
+        reductions = list(churn_reduction.values())
+    else:
+        names, reductions = ['churn_reduction'], [churn_reduction]
+    return pd.DataFrame(list(itertools.product(activation, upsell, *reductions)),
+                        columns=['activation', 'upsell'] + names)
+
+
+def strategy_scenarios(strategies=STRATEGIES):
+    """One scenario per named strategy, with unset interventions at zero."""
+    return pd.DataFrame([{'activation': 0.0, 'upsell': 0.0, 'churn_reduction': 0.0, **levels}
+                         for levels in strategies.values()], index=pd.Index(list(strategies), name='strategy'))
+
+
+def _quietly(reduce, values, *args):
+    with warnings.catch_warnings():
+        # CLV is undefined (NaN) in replicates without Pro users
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return reduce(values, *args, axis=1)
+
+
+def percentiles(values, q):
+    """Percentiles `q` of each scenario's replicates, ignoring replicates where the KPI is undefined."""
+    return _quietly(np.nanpercentile, values, q)
+
+
+def summarize(results, interval=0.9, index=None):
+    """Mean and `interval` bounds of each KPI per scenario (rows labelled by `index`)."""
+    tail = (1 - interval) / 2 * 100
+    columns = {}
+    for kpi, values in results.items():
+        columns[(kpi, 'mean')] = _quietly(np.nanmean, values)
+        columns[(kpi, 'low')], columns[(kpi, 'high')] = percentiles(values, [tail, 100 - tail])
+    return pd.DataFrame(columns, index=index)
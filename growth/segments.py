@@ -0,0 +1,191 @@
+# Behavioural user segments
+#
+# A StandardScaler and a MiniBatchKMeans model are fitted in one streaming pass
+# of mini-batches over the users' engagement features, then persisted as plain
+# arrays keyed by the dataset version, so later starts (and every gunicorn
+# worker) load them instead of refitting. Assigning users only needs those
+# arrays: each chunk of rows is scaled and matched to its nearest centroid in a
+# thread pool. Per-segment totals (users, churned, Pro, feature sums) are kept
+# alongside the labels and updated with each ingested batch.
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+FEATURES = ['total_sessions', 'page_views', 'download_clicks', 'days_active', 'monthly_revenue']
+N_SEGMENTS = 4
+BATCH_SIZE = 4096
+# Rows per assignment task
+_ASSIGN_CHUNK = 1 << 16
+
+MODEL_DIR_ENV = 'WPPOOL_SEGMENT_MODEL_DIR'
+_models = {}
+
+
+def model_dir():
+    return os.environ.get(MODEL_DIR_ENV) or os.path.join('.cache', 'segments')
+
+
+def _features(df):
+    return np.column_stack([df[column].to_numpy(dtype='float64', na_value=np.nan) for column in FEATURES])
+
+
+class SegmentModel:
+    def __init__(self, mean, scale, centers, version=None):
+        # Centers are in scaled units, ordered by total sessions (segment 0 is the least engaged)
+        self.mean = mean
+        self.scale = scale
+        self.centers = centers
+        self.version = version
+
+    @property
+    def n_segments(self):
+        return len(self.centers)
+
+    @property
+    def names(self):
+        return [f"Segment {number + 1}" for number in range(self.n_segments)]
+
+    @classmethod
+    def fit(cls, df, n_segments=N_SEGMENTS, batch_size=BATCH_SIZE, seed=0, version=None):
+        """Fit the scaler and one partial_fit pass of MiniBatchKMeans over shuffled mini-batches."""
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.preprocessing import StandardScaler
+
+        features = _features(df)
+        features = np.where(np.isnan(features), np.nanmedian(features, axis=0), features)
+        scaler = StandardScaler().fit(features)
+        model = MiniBatchKMeans(n_clusters=n_segments, batch_size=batch_size, random_state=seed, n_init=3)
+        order = np.random.default_rng(seed).permutation(len(features))
+        # The first batch seeds the centroids, so it must hold at least one user per segment
+        first = max(batch_size, 3 * n_segments)
+        model.partial_fit(scaler.transform(features[order[:first]]))
+        for start in range(first, len(order), batch_size):
+            model.partial_fit(scaler.transform(features[order[start:start + batch_size]]))
+        centers = model.cluster_centers_
+        engagement = centers[:, FEATURES.index('total_sessions')]
+        return cls(scaler.mean_, scaler.scale_, centers[np.argsort(engagement, kind='stable')], version)
+
+    def assign(self, df, max_workers=None):
+        """Segment number of every row of `df` (no refitting)."""
+        features = _features(df)
+        labels = np.empty(len(features), dtype=np.int8)
+        squared_centers = (self.centers ** 2).sum(axis=1)
+
+        def assign_chunk(start):
+            scaled = (features[start:start + _ASSIGN_CHUNK] - self.mean) / self.scale
+            # Missing features sit at the mean
+            scaled = np.nan_to_num(scaled, nan=0.0)
+            distances = squared_centers - 2 * scaled @ self.centers.T
+            labels[start:start + _ASSIGN_CHUNK] = distances.argmin(axis=1)
+
+        starts = range(0, len(features), _ASSIGN_CHUNK)
+        if len(starts) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+                list(pool.map(assign_chunk, starts))
+        elif starts:
+            assign_chunk(0)
+        return labels
+
+    def profile(self):
+        """Segment centroids in the features' own units."""
+        return pd.DataFrame(self.centers * self.scale + self.mean, index=self.names, columns=FEATURES)
+
+    def save(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, mean=self.mean, scale=self.scale, centers=self.centers)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, version=None):
+        with np.load(path) as arrays:
+            return cls(arrays['mean'], arrays['scale'], arrays['centers'], version)
+
+
+def get_segment_model(df, version, n_segments=N_SEGMENTS):
+    """The SegmentModel for this dataset version: from memory, from the model directory, or fitted."""
+    key = (version, n_segments)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    path = os.path.join(model_dir(), f"segments-{version}-{n_segments}.npz")
+    try:
+        model = SegmentModel.load(path, version)
+    except (OSError, ValueError, KeyError):
+        model = SegmentModel.fit(df, n_segments, version=version)
+        try:
+            os.makedirs(model_dir(), exist_ok=True)
+            model.save(path)
+        except OSError:
+            # Read-only hosts refit on each start
+            pass
+    _models[key] = model
+    return model
+
+
+def _totals(df, labels, n_segments, rows=None):
+    # Per segment: users, churned, Pro, then the sum of each feature
+    def gather(values):
+        # Select the rows before converting, not the whole column
+        return (values if rows is None else values[rows]).astype('float64')
+
+    if rows is not None:
+        labels = labels[rows]
+    columns = [np.ones(len(labels)),
+               gather(df['churned'].fillna(0).to_numpy()),
+               gather(df['subscription_type'].eq('Pro').to_numpy())]
+    columns += [np.nan_to_num(gather(df[column].to_numpy(dtype='float64', na_value=np.nan)
+                                     if df[column].hasnans else df[column].to_numpy()))
+                for column in FEATURES]
+    totals = np.empty((n_segments, len(columns)))
+    for number, values in enumerate(columns):
+        totals[:, number] = np.bincount(labels, weights=values, minlength=n_segments)
+    return totals
+
+
+class Segments:
+    """Segment labels of every row of a table, with per-segment totals.
+
+    `labels` is aligned with the table's row positions; `update` keeps both
+    current as rows are replaced and appended.
+    """
+
+    def __init__(self, model, labels, totals):
+        self.model = model
+        self.labels = labels
+        self.totals = totals
+
+    @classmethod
+    def assign(cls, model, df):
+        labels = model.assign(df)
+        return cls(model, labels, _totals(df, labels, model.n_segments))
+
+    def update(self, updated_positions, updated, removed, inserted):
+        """Segments after rows at `updated_positions` were replaced by `updated` (`removed` holds
+        their previous values) and `inserted` was appended to the table."""
+        n_segments = self.model.n_segments
+        labels = np.concatenate([self.labels, self.model.assign(inserted)])
+        totals = self.totals + _totals(inserted, labels[len(self.labels):], n_segments)
+        if len(updated):
+            totals -= _totals(removed, self.labels[updated_positions], n_segments)
+            labels[updated_positions] = self.model.assign(updated)
+            totals += _totals(updated, labels[updated_positions], n_segments)
+        return Segments(self.model, labels, totals)
+
+    def summary(self, df=None, rows=None):
+        """Users, share, churn rate, Pro rate and mean features of each segment.
+
+        With `rows`, only those row positions of the full table `df` are counted.
+        """
+        totals = self.totals if rows is None else _totals(df, self.labels, self.model.n_segments, rows)
+        users = totals[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            summary = pd.DataFrame({'users': users.astype('int64'),
+                                    'share': users / max(users.sum(), 1) * 100,
+                                    'churn_rate': totals[:, 1] / users * 100,
+                                    'pro_rate': totals[:, 2] / users * 100},
+                                   index=pd.Index(self.model.names, name='segment'))
+            for number, feature in enumerate(FEATURES):
+                summary[feature] = totals[:, 3 + number] / users
+        return summary[summary['users'] > 0]
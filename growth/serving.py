@@ -0,0 +1,59 @@
+# Boot-time helpers for serving a dashboard from several gunicorn workers
+#
+# gunicorn.conf.py imports the app once in the master process and forks every
+# worker from it. Whatever the master has built by then (the memory-mapped
+# table, the aggregate cube, the filter index and the rendered analyses in the
+# figure cache) is shared by all workers instead of being rebuilt per worker.
+import gc
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def analysis_dropdown(component):
+    """The analysis dropdown, found anywhere in the app layout (None without one)."""
+    if getattr(component, 'id', None) == 'analysis-dropdown':
+        return component
+    children = getattr(component, 'children', None)
+    if not isinstance(children, (list, tuple)):
+        children = [children] if children is not None else []
+    for child in children:
+        dropdown = analysis_dropdown(child)
+        if dropdown is not None:
+            return dropdown
+    return None
+
+
+def analysis_values(component):
+    """Values of the analysis dropdown, found anywhere in the app layout."""
+    dropdown = analysis_dropdown(component)
+    return [option['value'] for option in dropdown.options] if dropdown is not None else []
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def warm_up(app, callback, dataset=None, max_workers=None):
+    """Render every analysis of `app` through `callback`, in parallel threads.
+
+    With `dataset`, its filter index is built alongside. Returns the seconds
+    each task took, keyed by analysis value.
+    """
+    values = analysis_values(app.layout)
+    with ThreadPoolExecutor(max_workers=max_workers or len(values) + 1) as pool:
+        futures = {value: pool.submit(_timed, callback, value) for value in values}
+        if dataset is not None:
+            futures['filter_index'] = pool.submit(_timed, dataset.filter_index)
+        return {name: future.result() for name, future in futures.items()}
+
+
+def freeze_heap():
+    """Exempt everything allocated so far from garbage collection.
+
+    Collections write to every tracked object's header, which would make each
+    forked worker copy the master's heap pages; frozen objects are skipped.
+    """
+    gc.collect()
+    gc.freeze()
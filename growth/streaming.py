@@ -0,0 +1,318 @@
+# Out-of-core cleaning and aggregation for growth exports larger than RAM
+#
+# Mirrors the dashboard's cleaning step (growth.cleaning: median fills, zero
+# revenue fill, duplicate removal, then describe(include='all')) but reads the
+# CSV in chunks:
+#
+#   pass 1  feeds each fill column into a mergeable quantile sketch to get its median
+#   pass 2  fills, drops rows whose hash was already seen, and merges each chunk
+#           into the aggregate cube and a streaming summary
+#
+# Peak memory is set by the chunk size and the sketch size; the dedup hashes
+# (8 bytes per distinct row) can be spilled to memory-mapped files.
+import argparse
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from growth.aggregates import AggregateCube
+from growth.cleaning import MEDIAN_FILL_COLUMNS, ZERO_FILL_COLUMNS
+from growth.loader import apply_schema
+
+DEFAULT_CHUNKSIZE = 250000
+DEFAULT_SKETCH_SIZE = 2048
+DEFAULT_SPILL_ROWS = 4000000
+
+
+class QuantileSketch:
+    """Mergeable approximate quantile sketch (a simplified KLL compactor stack).
+
+    Level h holds items of weight 2**h. When a level exceeds `k` items it is
+    sorted and every other item, from a random offset, is promoted to the next
+    level, so memory stays at O(k log(n / k)) however many values are added.
+    """
+
+    def __init__(self, k=DEFAULT_SKETCH_SIZE, seed=0):
+        self.k = k
+        self.count = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        self.count += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        self.count += other.count
+        for height, items in enumerate(other.levels):
+            if height == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[height] = np.concatenate([self.levels[height], items])
+        self._compress()
+        return self
+
+    def _compress(self):
+        height = 0
+        while height < len(self.levels):
+            items = self.levels[height]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # An odd item out stays behind so no weight is lost
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                paired = items[:len(items) - len(keep)]
+                promoted = paired[self._rng.integers(2)::2]
+                self.levels[height] = keep
+                if height + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[height + 1] = np.concatenate([self.levels[height + 1], promoted])
+            height += 1
+
+    def quantile(self, q):
+        if not self.count:
+            return np.nan
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** height) for height, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        return float(items[order][np.searchsorted(cumulative, q * cumulative[-1])])
+
+
+class RowDeduplicator:
+    """Remembers 64-bit row hashes across chunks in sorted, log-structured runs.
+
+    Runs are merged whenever a newer run grows to the size of the one before
+    it, and runs larger than `spill_rows` are written to `spill_dir` and
+    memory-mapped back, so the seen-set does not have to stay resident.
+    """
+
+    def __init__(self, spill_dir=None, spill_rows=DEFAULT_SPILL_ROWS):
+        self.spill_dir = spill_dir
+        self.spill_rows = spill_rows
+        self._runs = []
+        self._spilled = 0
+
+    def __len__(self):
+        return sum(len(run) for run in self._runs)
+
+    def first_seen(self, hashes):
+        """Boolean mask of rows whose hash has not been seen in this or an earlier chunk."""
+        uniques, first = np.unique(hashes, return_index=True)
+        seen = np.zeros(len(uniques), dtype=bool)
+        for run in self._runs:
+            positions = np.searchsorted(run, uniques).clip(max=len(run) - 1)
+            seen |= np.asarray(run[positions]) == uniques
+        mask = np.zeros(len(hashes), dtype=bool)
+        mask[first[~seen]] = True
+        self._add_run(uniques[~seen])
+        return mask
+
+    def _add_run(self, run):
+        if not len(run):
+            return
+        self._runs.append(run)
+        while len(self._runs) > 1 and len(self._runs[-2]) <= len(self._runs[-1]):
+            newest = self._runs.pop()
+            merged = np.sort(np.concatenate([self._runs.pop(), newest]))
+            self._runs.append(self._spill(merged))
+
+    def _spill(self, run):
+        if not self.spill_dir or len(run) < self.spill_rows:
+            return run
+        path = os.path.join(self.spill_dir, f"seen-{self._spilled}.npy")
+        self._spilled += 1
+        np.save(path, run)
+        return np.load(path, mmap_mode='r')
+
+
+class StreamingSummary:
+    """describe(include='all') accumulated chunk by chunk."""
+
+    def __init__(self, sketch_size=DEFAULT_SKETCH_SIZE):
+        self.sketch_size = sketch_size
+        self.columns = []
+        self.numeric = {}
+        self.categorical = {}
+
+    def update(self, chunk):
+        for column in chunk.columns:
+            if column not in self.columns:
+                self.columns.append(column)
+            series = chunk[column]
+            if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+                self._update_numeric(column, series)
+            else:
+                counts = series.value_counts(dropna=True)
+                known = self.categorical.get(column)
+                self.categorical[column] = counts if known is None else known.add(counts, fill_value=0)
+        return self
+
+    def _update_numeric(self, column, series):
+        is_datetime = pd.api.types.is_datetime64_any_dtype(series)
+        if is_datetime:
+            values = series.dropna().astype('datetime64[ns]').astype('int64').to_numpy(dtype='float64')
+        else:
+            values = series.dropna().to_numpy(dtype='float64')
+        stats = self.numeric.setdefault(column, {
+            'datetime': is_datetime, 'count': 0, 'sum': 0.0, 'sumsq': 0.0,
+            'min': np.inf, 'max': -np.inf, 'sketch': QuantileSketch(self.sketch_size)})
+        if not len(values):
+            return
+        stats['count'] += len(values)
+        stats['sum'] += values.sum()
+        stats['sumsq'] += (values * values).sum()
+        stats['min'] = min(stats['min'], values.min())
+        stats['max'] = max(stats['max'], values.max())
+        stats['sketch'].add(values)
+
+    def to_frame(self):
+        index = ['count', 'unique', 'top', 'freq', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+        summary = {}
+        for column in self.columns:
+            if column in self.numeric:
+                stats = self.numeric[column]
+                n = stats['count']
+                mean = stats['sum'] / n if n else np.nan
+                variance = (stats['sumsq'] - n * mean * mean) / (n - 1) if n > 1 else np.nan
+                values = {'count': n, 'mean': mean, 'min': stats['min'], 'max': stats['max'],
+                          '25%': stats['sketch'].quantile(0.25), '50%': stats['sketch'].quantile(0.5),
+                          '75%': stats['sketch'].quantile(0.75)}
+                if stats['datetime']:
+                    values = {name: value if name == 'count' else pd.Timestamp(int(value))
+                              for name, value in values.items() if not (name != 'count' and np.isnan(value))}
+                else:
+                    values['std'] = np.sqrt(max(variance, 0)) if n > 1 else np.nan
+                summary[column] = values
+            elif column in self.categorical:
+                counts = self.categorical[column]
+                summary[column] = {'count': int(counts.sum()), 'unique': len(counts),
+                                   'top': counts.idxmax() if len(counts) else np.nan,
+                                   'freq': int(counts.max()) if len(counts) else np.nan}
+        return pd.DataFrame(summary, index=index)
+
+
+class StreamingResult:
+    def __init__(self, medians, rows_read, duplicates_removed, cube, summary, version):
+        self.medians = medians
+        self.rows_read = rows_read
+        self.duplicates_removed = duplicates_removed
+        self.cube = cube
+        self.summary = summary
+        self.version = version
+
+
+def read_chunks(csv_path, chunksize=DEFAULT_CHUNKSIZE):
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        yield apply_schema(chunk)
+
+
+def fill_medians(csv_path, chunksize=DEFAULT_CHUNKSIZE, sketch_size=DEFAULT_SKETCH_SIZE):
+    """Approximate median of each median-filled column, in one pass over the file.
+
+    Also returns the columns that had missing values anywhere in the file, which
+    become float once filled, just as they would be when read in one piece.
+    """
+    sketches = {column: QuantileSketch(sketch_size) for column in MEDIAN_FILL_COLUMNS}
+    rows = 0
+    for chunk in read_chunks(csv_path, chunksize):
+        rows += len(chunk)
+        for column, sketch in sketches.items():
+            sketch.add(chunk[column].to_numpy(dtype='float64', na_value=np.nan))
+    medians = {column: sketch.quantile(0.5) for column, sketch in sketches.items()}
+    return medians, [column for column, sketch in sketches.items() if sketch.count < rows]
+
+
+def _row_hashes(chunk):
+    # Hash numeric columns as float64 so a column that picked up a NaN (and so
+    # became float) in one chunk hashes the same as its int counterpart elsewhere
+    normalized = chunk.copy()
+    for column in normalized.select_dtypes(include='number').columns:
+        normalized[column] = normalized[column].astype('float64')
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+
+def clean_in_chunks(csv_path, chunksize=DEFAULT_CHUNKSIZE, output_path=None, spill_dir=None,
+                    sketch_size=DEFAULT_SKETCH_SIZE):
+    """Clean and aggregate a growth export without loading it whole.
+
+    Cleaned rows are optionally written to `output_path` as Parquet. Returns a
+    StreamingResult with the fill medians, row counts, aggregate cube, summary
+    frame and a content version for the cleaned rows.
+    """
+    medians, float_columns = fill_medians(csv_path, chunksize, sketch_size)
+    fill_values = dict(medians, **{column: 0 for column in ZERO_FILL_COLUMNS})
+
+    with tempfile.TemporaryDirectory(dir=spill_dir) as spill:
+        deduplicator = RowDeduplicator(spill_dir=spill)
+        summary = StreamingSummary(sketch_size)
+        version = hashlib.sha1()
+        cube = None
+        writer = None
+        rows_read = 0
+        rows_kept = 0
+        try:
+            for chunk in read_chunks(csv_path, chunksize):
+                rows_read += len(chunk)
+                chunk = chunk.fillna(fill_values).astype({column: 'float64' for column in float_columns})
+                hashes = _row_hashes(chunk)
+                keep = deduplicator.first_seen(hashes)
+                chunk = chunk[keep]
+                rows_kept += len(chunk)
+                version.update(hashes[keep].tobytes())
+
+                summary.update(chunk)
+                chunk_cube = AggregateCube.from_frame(chunk)
+                cube = chunk_cube if cube is None else cube.merge(chunk_cube)
+                if output_path:
+                    writer = _write_chunk(writer, output_path, chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    if cube is not None:
+        cube.version = version.hexdigest()[:16]
+    return StreamingResult(medians, rows_read, rows_read - rows_kept, cube, summary.to_frame(),
+                           version.hexdigest()[:16])
+
+
+def _write_chunk(writer, output_path, chunk):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Chunk-local categories differ from chunk to chunk, so text is written as
+    # plain strings (Parquet dictionary-encodes them anyway)
+    text_columns = [column for column in chunk.columns
+                    if isinstance(chunk[column].dtype, pd.CategoricalDtype) or chunk[column].dtype == object]
+    chunk = chunk.astype({column: object for column in text_columns})
+    if writer is None:
+        schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+        for column in text_columns:
+            schema = schema.set(schema.get_field_index(column), pa.field(column, pa.string()))
+        writer = pq.ParquetWriter(output_path, schema)
+    writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False))
+    return writer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Clean and summarize a growth export in bounded memory.')
+    parser.add_argument('csv_path')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--output', help='write the cleaned rows to this Parquet file')
+    parser.add_argument('--spill-dir', help='directory for memory-mapped dedup hashes')
+    args = parser.parse_args()
+
+    result = clean_in_chunks(args.csv_path, args.chunksize, args.output, args.spill_dir)
+    print(f"Rows read: {result.rows_read}")
+    print(f"Duplicates removed: {result.duplicates_removed}")
+    print(f"Fill medians: {result.medians}")
+    print(result.summary.to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+# Production serving with several workers:
+#
+#   gunicorn -c gunicorn.conf.py
+#
+# The app is imported once in the master (preload_app), its analyses are
+# rendered there in parallel, and every worker is forked from the result, so
+# the dataset, its aggregates and the warmed figure cache are shared pages
+# rather than one copy per worker. Ingested rows are journaled and replayed by
+# every worker, so all of them serve the same dataset version.
+import multiprocessing
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# index:server is the full dashboard; api.index:server and data.dashboard:server also work
+wsgi_app = os.environ.get('WPPOOL_WSGI_APP', 'index:server')
+pythonpath = ROOT
+# gunicorn puts `chdir` first on sys.path, so it stays at ROOT: from api/, `index`
+# would be api/index.py. The apps find their CSV through WPPOOL_DATA_DIR instead
+chdir = ROOT
+data_dir = os.environ['WPPOOL_DATA_DIR'] = os.path.abspath(os.environ.get('WPPOOL_DATA_DIR', os.path.join(ROOT, 'api')))
+bind = os.environ.get('WPPOOL_BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('WEB_CONCURRENCY', min(2 * multiprocessing.cpu_count() + 1, 8)))
+worker_class = 'gthread'
+threads = int(os.environ.get('WPPOOL_THREADS', 4))
+preload_app = True
+timeout = 120
+
+os.environ.setdefault('WPPOOL_INGEST_JOURNAL_DIR', os.path.join(data_dir, '.cache', 'ingest'))
+# Responses rendered by one worker are served from disk by the others
+os.environ.setdefault('WPPOOL_FIGURE_CACHE_DIR', os.path.join(data_dir, '.cache', 'figures'))
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported and before any worker is forked
+    from growth.serving import freeze_heap, warm_up
+
+    module = sys.modules[wsgi_app.split(':')[0]]
+    timings = warm_up(module.app, module.update_graph, getattr(module, 'dataset', None))
+    server.log.info('Warmed up %s', ', '.join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    freeze_heap()
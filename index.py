@@ -1,32 +1,64 @@
+import os
+
+import numpy as np
 import pandas as pd
 import dash
 from dash import dcc, html
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import plotly.express as px
 import plotly.graph_objects as go
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
+from plotly.subplots import make_subplots
+
+from growth import cro, scenarios
+from growth.cleaning import clean_growth_data
+from growth.controls import FILTER_CHOICE_PROPS, filter_choices, filter_controls
+from growth.engagement import engagement_figure
+from growth.figure_cache import cached_analysis, default_cache, enable_layout_etags
+from growth.filters import make_filters
+from growth.jobs import POLL_INTERVAL_MS, JobRunner, background_analyses, report_progress
+from growth.live import LiveDataset, register_ingest_route
+from growth.loader import data_path, load_growth_data
+from growth.metrics import CallbackMetrics, phase, register_metrics_routes
 
 # Load the dataset
 # Replace 'your_dataset.csv' with the actual file path
-df = pd.read_csv('wppool_growth_data_sample_20k.csv')
+df = load_growth_data(data_path('wppool_growth_data_sample_20k.csv'))
 
 # Data Exploration & Cleaning
-# Handle missing values
-df.fillna({'total_sessions': df['total_sessions'].median(),
-           'page_views': df['page_views'].median(),
-           'days_active': df['days_active'].median(),
-           'monthly_revenue': 0}, inplace=True)
-
-# Remove duplicates
-df.drop_duplicates(inplace=True)
+# Fill missing values (medians for engagement, 0 for revenue) and remove duplicates
+df, duplicates_removed = clean_growth_data(df)
 
 # Summary of the dataset
 summary = df.describe(include='all')
-free_pro_distribution = df['subscription_type'].value_counts(normalize=True) * 100
+
+# Live dataset: accepts upserts keyed on user_id and keeps the aggregate cube
+# shared by every analysis below current. Under gunicorn, workers share ingested
+# rows through a journal in WPPOOL_INGEST_JOURNAL_DIR
+dataset = LiveDataset(df, journal_dir=os.environ.get('WPPOOL_INGEST_JOURNAL_DIR'))
+
+REFRESH_INTERVAL_MS = int(os.environ.get('WPPOOL_REFRESH_INTERVAL_MS', 30000))
 
 # Initialize the Dash app
 app = dash.Dash(__name__)
+enable_layout_etags(app)
+
+# WSGI entry point for gunicorn (see gunicorn.conf.py)
+server = app.server
+
+# Rendered responses keyed on (analysis, filters, dataset version)
+figure_cache = default_cache()
+
+# Per-analysis latency, cache and payload metrics for Prometheus at /metrics
+callback_metrics = CallbackMetrics()
+register_metrics_routes(app.server, callback_metrics)
+
+# Analyses slow enough to render in the background job pool (see growth.jobs)
+BACKGROUND_ANALYSES = {'engagement', 'cohorts', 'segments', 'cro', 'kpi', 'market'}
+job_runner = JobRunner()
+
+# POST new or changed user rows to /api/users to update the dashboard without a reload
+# (only served when WPPOOL_INGEST_TOKEN is set)
+register_ingest_route(app.server, dataset, token=os.environ.get('WPPOOL_INGEST_TOKEN'))
 
 # Define the layout of the dashboard
 app.layout = html.Div([
@@ -40,6 +72,8 @@ app.layout = html.Div([
             {'label': 'User Engagement Analysis', 'value': 'engagement'},
             {'label': 'Churn Analysis', 'value': 'churn'},
             {'label': 'Revenue & Upgrade Trends', 'value': 'revenue'},
+            {'label': 'Cohort Retention & Time to Upgrade', 'value': 'cohorts'},
+            {'label': 'Behavioural User Segments', 'value': 'segments'},
             {'label': 'Actionable Growth Recommendations', 'value': 'growth'},
             {'label': 'Conversion Rate Optimization (CRO)', 'value': 'cro'},
             {'label': 'Growth Strategy & KPI Recommendations', 'value': 'kpi'},
@@ -49,43 +83,81 @@ app.layout = html.Div([
         value='exploration',  # Default selection
         style={'width': '90%', 'margin': 'auto', 'marginBottom': '20px'}
     ),
+
+    # Cross-filters applied to every analysis
+    filter_controls(dataset.frame),
     
     # Graph container
-    html.Div(id='graph-container', style={'marginTop': '20px', 'width': '90%', 'margin': 'auto'})
+    html.Div(id='graph-container', style={'marginTop': '20px', 'width': '90%', 'margin': 'auto'}),
+
+    # Polls for ingested data so open dashboards refresh themselves
+    dcc.Store(id='data-version'),
+    dcc.Interval(id='refresh-interval', interval=REFRESH_INTERVAL_MS),
+
+    # Polls the progress of a background analysis while one is pending
+    dcc.Interval(id='job-poll', interval=POLL_INTERVAL_MS, disabled=True)
 ])
 
-# Callback to update the graph based on dropdown selection
+# Publish the dataset version to the browser only when ingested rows changed it
 @app.callback(
-    Output('graph-container', 'children'),
-    [Input('analysis-dropdown', 'value')]
+    Output('data-version', 'data'),
+    [Input('refresh-interval', 'n_intervals')],
+    [State('data-version', 'data')]
 )
-def update_graph(selected_analysis):
+def poll_data_version(n_intervals, known_version):
+    return dash.no_update if known_version == dataset.version else dataset.version
+
+# Rebuild the filter choices when ingested rows add a country, plan or install date
+@app.callback(
+    [Output(component, prop) for component, prop in FILTER_CHOICE_PROPS],
+    [Input('data-version', 'data')],
+    prevent_initial_call=True
+)
+def refresh_filter_choices(data_version):
+    return filter_choices(dataset.frame)
+
+# Render an analysis (the dashboard callback below runs the heavy ones as background jobs)
+# data_version only triggers a re-render; the dataset version is already in the key
+@cached_analysis(figure_cache, 'index', lambda: dataset.version, callback_metrics, ignore=('data_version',))
+def update_graph(selected_analysis, countries=None, plans=None, subscriptions=None,
+                 start_date=None, end_date=None, data_version=None):
+    view = dataset.view(make_filters(countries, plans, subscriptions, start_date, end_date))
+    if view.n_rows == 0:
+        return html.P("No users match the selected filters.", style={'textAlign': 'center'})
+    cube = view.cube
     if selected_analysis == 'exploration':
         # Data Exploration & Cleaning
+        free_pro_distribution = cube.rollup('subscription_type', stat='count') / cube.n_rows * 100
         return html.Div([
             html.H3("Data Summary", style={'textAlign': 'center'}),
-            html.P(f"Total Users: {len(df)}", style={'textAlign': 'center'}),
-            html.P(f"Free Users: {free_pro_distribution['Free']:.2f}%", style={'textAlign': 'center'}),
-            html.P(f"Pro Users: {free_pro_distribution['Pro']:.2f}%", style={'textAlign': 'center'}),
+            html.P(f"Total Users: {cube.n_rows}", style={'textAlign': 'center'}),
+            html.P(f"Free Users: {free_pro_distribution.get('Free', 0):.2f}%", style={'textAlign': 'center'}),
+            html.P(f"Pro Users: {free_pro_distribution.get('Pro', 0):.2f}%", style={'textAlign': 'center'}),
             html.H3("Missing Values Handled", style={'textAlign': 'center'}),
             html.P("Missing values were filled with medians for numerical columns and 0 for revenue.", style={'textAlign': 'center'}),
             html.H3("Duplicates Removed", style={'textAlign': 'center'}),
-            html.P(f"{df.duplicated().sum()} duplicates were removed.", style={'textAlign': 'center'})
+            html.P(f"{duplicates_removed} duplicates were removed.", style={'textAlign': 'center'})
         ])
     
     elif selected_analysis == 'engagement':
         # User Engagement Analysis
-        avg_sessions = df.groupby('subscription_type')['total_sessions'].mean()
-        top_users = df.nlargest(5, 'total_sessions')[['user_id', 'total_sessions', 'subscription_type']]
-        top_countries = df.groupby('country')['total_sessions'].sum().nlargest(5)
+        avg_sessions = cube.rollup('subscription_type', 'total_sessions', stat='mean')
+        top_users = cube.top_users
+        top_countries = cube.rollup('country', 'total_sessions').nlargest(5)
+        with phase('figure'):
+            sessions_fig = px.bar(avg_sessions, x=avg_sessions.index, y=avg_sessions.values,
+                                  labels={'x': 'Subscription Type', 'y': 'Average Sessions'},
+                                  title='Average Sessions by Subscription Type',
+                                  color_discrete_sequence=px.colors.qualitative.Pastel)
+            countries_fig = px.bar(top_countries, x=top_countries.index, y=top_countries.values,
+                                   labels={'x': 'Country', 'y': 'Total Sessions'},
+                                   title='Top 5 Countries by Engagement',
+                                   color_discrete_sequence=px.colors.qualitative.Pastel)
         
         return html.Div([
             
                 html.H3("Average Sessions for Free vs. Pro Users", style={'textAlign': 'center'}),
-                dcc.Graph(figure=px.bar(avg_sessions, x=avg_sessions.index, y=avg_sessions.values,
-                                        labels={'x': 'Subscription Type', 'y': 'Average Sessions'},
-                                        title='Average Sessions by Subscription Type',
-                                        color_discrete_sequence=px.colors.qualitative.Pastel)),
+                dcc.Graph(figure=sessions_fig),
 
                 html.H3("Top 5 Most Active Users", style={'textAlign': 'center'}),
                 html.Table([
@@ -100,42 +172,56 @@ def update_graph(selected_analysis):
                 ], style={'margin': 'auto', 'width': '90%'}),
 
                 html.H3("Top 5 Countries with Highest Engagement", style={'textAlign': 'center'}),
-                dcc.Graph(figure=px.bar(top_countries, x=top_countries.index, y=top_countries.values,
-                                        labels={'x': 'Country', 'y': 'Total Sessions'},
-                                        title='Top 5 Countries by Engagement',
-                                        color_discrete_sequence=px.colors.qualitative.Pastel))
+                dcc.Graph(figure=countries_fig)
 
 
         ])
     
     elif selected_analysis == 'churn':
         # Churn Analysis
-        churn_rate = df.groupby('subscription_type')['churned'].mean() * 100
-        correlation = df.corr()['churned'].sort_values(ascending=False)
-        churn_trends = df.groupby(['subscription_type', 'churned']).size().unstack()
+        churn_rate = cube.share('subscription_type', where={'churned': 1}) * 100
+        # Point-biserial correlation of each measure, and mutual information of each segment, with churn
+        drivers = cube.churn_drivers()
+        correlation = drivers.point_biserial()
+        segment_drivers = drivers.segment_drivers()
+        churn_trends = cube.rollup(['subscription_type', 'churned'], stat='count').unstack()
+        with phase('figure'):
+            rate_fig = px.pie(churn_rate, values=churn_rate.values, names=churn_rate.index,
+                              title='Churn Rate by Subscription Type', hole=0.4,
+                              color_discrete_sequence=px.colors.qualitative.Pastel)
+            trends_fig = px.bar(churn_trends, barmode='group',
+                                labels={'value': 'Number of Users', 'subscription_type': 'Subscription Type'},
+                                title='Churn Trends: Free vs. Pro Users',
+                                color_discrete_sequence=px.colors.qualitative.Pastel)
         
         return html.Div([
             html.H3("Churn Rate by Subscription Type", style={'textAlign': 'center'}),
-            dcc.Graph(figure=px.pie(churn_rate, values=churn_rate.values, names=churn_rate.index,
-                                    title='Churn Rate by Subscription Type', hole=0.4,
-                                    color_discrete_sequence=px.colors.qualitative.Pastel)),
+            dcc.Graph(figure=rate_fig),
             html.H3("Top 3 Factors Contributing to Churn", style={'textAlign': 'center'}),
-            html.P(f"1. {correlation.index[1]}: {correlation.values[1]:.2f}", style={'textAlign': 'center'}),
-            html.P(f"2. {correlation.index[2]}: {correlation.values[2]:.2f}", style={'textAlign': 'center'}),
-            html.P(f"3. {correlation.index[3]}: {correlation.values[3]:.2f}", style={'textAlign': 'center'}),
+            *[html.P(f"{rank}. {factor}: {value:+.2f} ({'more' if value > 0 else 'less'} churn as it rises)",
+                     style={'textAlign': 'center'})
+              for rank, (factor, value) in enumerate(correlation.head(3).items(), start=1)],
+            html.H3("Churn by Segment", style={'textAlign': 'center'}),
+            *[html.P(f"{row.key}: {row.mutual_information:.5f} bits of mutual information "
+                     f"(most churn-prone: {'none' if pd.isna(row.value) else row.value}, {row.correlation:.3f})",
+                     style={'textAlign': 'center'})
+              for row in segment_drivers.itertuples()],
             html.H3("Churn Trends: Free vs. Pro Users", style={'textAlign': 'center'}),
-            dcc.Graph(figure=px.bar(churn_trends, barmode='group',
-                                    labels={'value': 'Number of Users', 'subscription_type': 'Subscription Type'},
-                                    title='Churn Trends: Free vs. Pro Users',
-                                    color_discrete_sequence=px.colors.qualitative.Pastel))
+            dcc.Graph(figure=trends_fig)
         ])
     
     elif selected_analysis == 'revenue':
         # Revenue & Upgrade Trends
-        upgrade_percentage = (df[df['subscription_type'] == 'Pro']['user_id'].nunique() / df['user_id'].nunique()) * 100
-        total_revenue = df[df['subscription_type'] == 'Pro']['monthly_revenue'].sum()
-        revenue_by_plan = df[df['subscription_type'] == 'Pro'].groupby('plan_type')['monthly_revenue'].sum()
-        upgrade_time = df[df['subscription_type'] == 'Pro']['days_active'].mean()
+        pro = {'subscription_type': 'Pro'}
+        upgrade_percentage = cube.rollup(stat='count', where=pro) / cube.n_rows * 100
+        total_revenue = cube.rollup(measure='monthly_revenue', where=pro)
+        revenue_by_plan = cube.rollup('plan_type', 'monthly_revenue', where=pro)
+        # Days from install to upgrade, from the upgrade dates
+        upgrade_time = dataset.cohorts().mean_upgrade_time(view.rows)
+        with phase('figure'):
+            plan_fig = px.pie(revenue_by_plan, values=revenue_by_plan.values, names=revenue_by_plan.index,
+                              title='Revenue by Pro Plan', hole=0.4,
+                              color_discrete_sequence=px.colors.qualitative.Pastel)
         
         return html.Div([
             html.H3("Percentage of Users Upgraded from Free to Pro", style={'textAlign': 'center'}),
@@ -143,20 +229,95 @@ def update_graph(selected_analysis):
             html.H3("Total Monthly Revenue from Pro Users", style={'textAlign': 'center'}),
             html.P(f"${total_revenue:,.2f}", style={'textAlign': 'center'}),
             html.H3("Revenue Contribution by Pro Plan", style={'textAlign': 'center'}),
-            dcc.Graph(figure=px.pie(revenue_by_plan, values=revenue_by_plan.values, names=revenue_by_plan.index,
-                                    title='Revenue by Pro Plan', hole=0.4,
-                                    color_discrete_sequence=px.colors.qualitative.Pastel)),
+            dcc.Graph(figure=plan_fig),
             html.H3("Average Time to Upgrade (Days)", style={'textAlign': 'center'}),
-            html.P(f"{upgrade_time:.2f} days", style={'textAlign': 'center'})
+            html.P("n/a (no upgrades in the selection)" if np.isnan(upgrade_time) else f"{upgrade_time:.2f} days",
+                   style={'textAlign': 'center'})
         ])
     
+    elif selected_analysis == 'cohorts':
+        # Cohort Retention & Time to Upgrade
+        cohorts = dataset.cohorts()
+        retention = cohorts.retention('month', view.rows) * 100
+        survival = cohorts.survival('churn', by='subscription_type', rows=view.rows) * 100
+        upgrades = cohorts.upgrade_distribution(7, view.rows)
+        upgrade_time_by_engagement = cohorts.upgrade_time_by('engagement_level', view.rows)
+        with phase('figure'):
+            retention_fig = px.imshow(retention, text_auto='.0f', aspect='auto', color_continuous_scale='Blues',
+                                      labels={'x': 'Months Since Install', 'y': 'Install Month', 'color': 'Active (%)'},
+                                      title='Monthly Cohort Retention (%)')
+            survival_fig = px.line(survival, labels={'value': 'Users Not Churned (%)', 'days since install': 'Days Since Install',
+                                                     'subscription_type': 'Subscription Type'},
+                                   title='Survival Curve (Kaplan-Meier): Free vs. Pro Users',
+                                   color_discrete_sequence=px.colors.qualitative.Pastel)
+            # Free-only selections have no upgrades to time
+            if upgrades.sum():
+                upgrades_fig = px.bar(x=upgrades.index, y=upgrades.values,
+                                      labels={'x': 'Days from Install to Upgrade', 'y': 'Upgrades'},
+                                      title='Time to Upgrade (Weekly Buckets)',
+                                      color_discrete_sequence=px.colors.qualitative.Pastel)
+                upgrade_section = [
+                    html.P(f"Average: {cohorts.mean_upgrade_time(view.rows):.2f} days", style={'textAlign': 'center'}),
+                    dcc.Graph(figure=upgrades_fig)
+                ]
+            else:
+                upgrade_section = [html.P("No users in the selection upgraded to Pro.", style={'textAlign': 'center'})]
+            if len(upgrade_time_by_engagement):
+                engagement_fig = px.bar(x=upgrade_time_by_engagement.index, y=upgrade_time_by_engagement.values,
+                                        labels={'x': 'Engagement Level', 'y': 'Average Days to Upgrade'},
+                                        title='Average Time to Upgrade by Engagement Level',
+                                        color_discrete_sequence=px.colors.qualitative.Pastel)
+                upgrade_section.append(dcc.Graph(figure=engagement_fig))
+
+        return html.Div([
+            html.H3("Retention by Install Month", style={'textAlign': 'center'}),
+            dcc.Graph(figure=retention_fig),
+            html.H3("Survival Curves", style={'textAlign': 'center'}),
+            dcc.Graph(figure=survival_fig),
+            html.H3("Time to Upgrade", style={'textAlign': 'center'})
+        ] + upgrade_section)
+
+    elif selected_analysis == 'segments':
+        # Behavioural User Segments (mini-batch k-means on engagement and revenue)
+        report_progress(message="Assigning users to segments (the model is fitted on first use)")
+        segments = dataset.segments()
+        summary = segments.summary(dataset.frame, view.rows)
+        profile = segments.model.profile().loc[summary.index]
+        rates = summary[['churn_rate', 'pro_rate']].rename(columns={'churn_rate': 'Churn Rate', 'pro_rate': 'Pro Rate'})
+        with phase('figure'):
+            size_fig = px.bar(summary, x=summary.index, y='users',
+                              labels={'segment': 'Segment', 'users': 'Users'},
+                              title='Users per Segment',
+                              color_discrete_sequence=px.colors.qualitative.Pastel)
+            rates_fig = px.bar(rates, barmode='group',
+                               labels={'value': 'Users (%)', 'segment': 'Segment', 'variable': 'Rate'},
+                               title='Churn and Pro Rate by Segment',
+                               color_discrete_sequence=px.colors.qualitative.Pastel)
+
+        return html.Div([
+            html.H3("Segment Sizes", style={'textAlign': 'center'}),
+            dcc.Graph(figure=size_fig),
+            html.H3("Churn and Upgrades by Segment", style={'textAlign': 'center'}),
+            dcc.Graph(figure=rates_fig),
+            html.H3("Segment Profiles (Cluster Centers)", style={'textAlign': 'center'}),
+            html.Table([
+                html.Thead(html.Tr([html.Th("Segment"), html.Th("Sessions"), html.Th("Page Views"),
+                                    html.Th("Download Clicks"), html.Th("Days Active"), html.Th("Monthly Revenue")])),
+                html.Tbody([
+                    html.Tr([html.Td(name)] + [html.Td(f"{value:,.1f}") for value in row])
+                    for name, row in zip(profile.index, profile.to_numpy())
+                ])
+            ], style={'margin': 'auto', 'width': '90%'})
+        ])
+
     elif selected_analysis == 'market':
         # Market Expansion Opportunities: Total Revenue by Country (Choropleth Map)
-        revenue_by_country = df.groupby('country')['monthly_revenue'].sum().reset_index()
-        fig = px.choropleth(revenue_by_country, locations='country', locationmode='country names',
-                             color='monthly_revenue', hover_name='country',
-                             title='Total Revenue by Country',
-                             color_continuous_scale=px.colors.sequential.Plasma)
+        revenue_by_country = cube.rollup('country', 'monthly_revenue').reset_index()
+        with phase('figure'):
+            fig = px.choropleth(revenue_by_country, locations='country', locationmode='country names',
+                                color='monthly_revenue', hover_name='country',
+                                title='Total Revenue by Country',
+                                color_continuous_scale=px.colors.sequential.Plasma)
         return dcc.Graph(figure=fig, config={'toImageButtonOptions': {'format': 'png', 'filename': 'market_expansion'}})
     
     elif selected_analysis == 'growth':
@@ -178,12 +339,65 @@ def update_graph(selected_analysis):
         ])
     
     elif selected_analysis == 'cro':
-        # Conversion Rate Optimization (CRO)
-        return html.Div([
+        # Conversion Rate Optimization (CRO): simulated A/B tests from the current Free -> Pro rate
+        baseline = cro.baseline(cube)
+        if not 0 < baseline['rate'] < 1:
+            return html.P("The selected users are all Free or all Pro, so there is no upgrade rate to test against.",
+                          style={'textAlign': 'center'})
+        uplift = cro.expected_uplift(baseline['users'], baseline['rate'],
+                                     revenue_per_upgrade=baseline['revenue_per_upgrade'])
+        ten_percent = uplift.loc['+10%']
+        with phase('figure'):
+            uplift_fig = px.bar(uplift, x=uplift.index, y='additional_upgrades',
+                                error_y=uplift['high'] - uplift['additional_upgrades'],
+                                error_y_minus=uplift['additional_upgrades'] - uplift['low'],
+                                labels={'uplift': 'Conversion Rate Uplift', 'additional_upgrades': 'Additional Pro Upgrades'},
+                                title='Expected Additional Upgrades (90% Interval)',
+                                color_discrete_sequence=px.colors.qualitative.Pastel)
+        impact = [
+            html.H3("Current Free to Pro Conversion", style={'textAlign': 'center'}),
+            html.P(f"{baseline['rate']:.2%} of {baseline['users']:,} users "
+                   f"(${baseline['revenue_per_upgrade']:,.2f} monthly revenue per Pro user)", style={'textAlign': 'center'}),
             html.H3("Impact of 10% Increase in Landing Page Conversion Rate", style={'textAlign': 'center'}),
-            html.P("Estimated additional Pro upgrades: 50", style={'textAlign': 'center'}),
+            html.P(f"Estimated additional Pro upgrades: {ten_percent['additional_upgrades']:,.0f} "
+                   f"(90% interval {ten_percent['low']:,.0f} to {ten_percent['high']:,.0f}), "
+                   f"${ten_percent['monthly_revenue']:,.2f} more monthly revenue", style={'textAlign': 'center'}),
+            dcc.Graph(figure=uplift_fig)
+        ]
+
+        def power_figure(curve, n_experiments):
+            fig = px.line(curve, log_x=True, markers=True,
+                          labels={'value': 'Power', 'users per arm': 'Users per Arm', 'uplift': 'Uplift'},
+                          title=f"Simulated Power ({n_experiments} Experiments per Point, alpha = {cro.ALPHA})",
+                          color_discrete_sequence=px.colors.qualitative.Pastel)
+            fig.add_hline(y=cro.TARGET_POWER, line_dash='dash', annotation_text=f"{cro.TARGET_POWER:.0%} power")
+            return fig
+
+        # In the background job, show the impact and the power curve so far while the simulation runs
+        def show_progress(fraction, partial_curve):
+            report_progress(fraction, f"Simulating A/B tests ({fraction:.0%})", html.Div(impact + [
+                html.H3("A/B Test Simulation", style={'textAlign': 'center'}),
+                dcc.Graph(figure=power_figure(partial_curve, round(fraction * cro.N_EXPERIMENTS)))
+            ]))
+
+        report_progress(0, "Simulating A/B tests", html.Div(impact))
+        curve = cro.power_curve(baseline['rate'], progress=show_progress)
+        sample_sizes = cro.sample_sizes(baseline['rate'], curve=curve)
+        with phase('figure'):
+            power_fig = power_figure(curve, cro.N_EXPERIMENTS)
+
+        return html.Div(impact + [
             html.H3("A/B Test Simulation", style={'textAlign': 'center'}),
-            html.P("Run A/B tests to evaluate changes in landing page design.", style={'textAlign': 'center'}),
+            dcc.Graph(figure=power_fig),
+            html.H3(f"Users per Arm for {cro.TARGET_POWER:.0%} Power", style={'textAlign': 'center'}),
+            html.Table([
+                html.Thead(html.Tr([html.Th("Uplift"), html.Th("Normal Approximation"), html.Th("Simulated")])),
+                html.Tbody([
+                    html.Tr([html.Td(label), html.Td(f"{row['analytic']:,.0f}"),
+                             html.Td("beyond the simulated range" if np.isnan(row['simulated']) else f"{row['simulated']:,.0f}")])
+                    for label, row in sample_sizes.iterrows()
+                ])
+            ], style={'margin': 'auto', 'width': '90%'}),
             html.H3("A/B Test Ideas", style={'textAlign': 'center'}),
             html.Ul([
                 html.Li("Test different headlines."),
@@ -193,54 +407,105 @@ def update_graph(selected_analysis):
         ])
     
     elif selected_analysis == 'kpi':
-        # Growth Strategy & KPI Recommendations
-        return html.Div([
+        # Growth Strategy & KPI Recommendations: Task_7's strategies simulated on the selected users
+        model = scenarios.ScenarioModel.from_frame(view.frame)
+        current = model.baseline()
+        strategies = scenarios.strategy_scenarios()
+        results = model.simulate(strategies)
+        kpis = [('churn_rate', 'Churn Rate (%)'), ('conversion_rate', 'Conversion Rate (%)'), ('clv', 'CLV ($)')]
+        with phase('figure'):
+            # Box statistics of the replicates rather than every simulated value
+            strategy_fig = make_subplots(rows=1, cols=len(kpis), subplot_titles=[label for _, label in kpis])
+            for column, (kpi, label) in enumerate(kpis, start=1):
+                low, q1, median, q3, high = scenarios.percentiles(results[kpi], [5, 25, 50, 75, 95])
+                strategy_fig.add_trace(go.Box(x=strategies.index, lowerfence=low, q1=q1, median=median, q3=q3,
+                                              upperfence=high, name=label, showlegend=False,
+                                              marker_color=px.colors.qualitative.Pastel[column - 1]),
+                                       row=1, col=column)
+            strategy_fig.update_layout(title=f"KPIs per Strategy ({scenarios.N_REPLICATES} Simulations Each, "
+                                             "5th-95th Percentile Whiskers)")
+        strategy_section = [
             html.H3("Key Performance Indicators (KPIs)", style={'textAlign': 'center'}),
             html.Ul([
-                html.Li("Churn Rate"),
-                html.Li("Conversion Rate (Free to Pro)"),
-                html.Li("Customer Lifetime Value (CLV)")
+                html.Li(f"Churn Rate: {current['churn_rate']:.2f}%"),
+                html.Li(f"Conversion Rate (Free to Pro): {current['conversion_rate']:.2f}%"),
+                html.Li("Customer Lifetime Value (CLV): "
+                        + ("no Pro users selected" if np.isnan(current['clv']) else f"${current['clv']:,.2f}"))
             ], style={'textAlign': 'center'}),
             html.H3("Actionable Growth Strategies", style={'textAlign': 'center'}),
             html.Ul([
                 html.Li("Improve onboarding and activation."),
-                html.Li("Run targeted upselling campaigns.")
+                html.Li("Run targeted upselling campaigns."),
+                html.Li("Retain users at risk of churning.")
             ], style={'textAlign': 'center'}),
+            dcc.Graph(figure=strategy_fig)
+        ]
+
+        grid = scenarios.scenario_grid(**scenarios.SWEEP)
+        report_progress(0.3, f"Simulating {len(grid)} what-if scenarios", html.Div(strategy_section))
+        sweep = grid.assign(clv=scenarios.summarize(model.simulate(grid))[('clv', 'mean')].to_numpy())
+        clv_grid = sweep[sweep['upsell'] == 0.07].pivot(index='churn_reduction', columns='activation', values='clv')
+        clv_grid = clv_grid.rename(index='{:.0%}'.format, columns='{:.0%}'.format)
+        with phase('figure'):
+            clv_fig = px.imshow(clv_grid, text_auto='.0f', aspect='auto', color_continuous_scale='Blues',
+                                labels={'x': 'Inactive Users Activated', 'y': 'Churners Retained', 'color': 'CLV ($)'},
+                                title=f"Average CLV with 7% Upselling ({len(grid)} Scenarios Simulated)")
+
+        return html.Div(strategy_section + [
+            html.H3("What-If Scenarios", style={'textAlign': 'center'}),
+            dcc.Graph(figure=clv_fig),
             html.H3("Success Measurement", style={'textAlign': 'center'}),
             html.P("Track churn rate reduction, conversion rate increase, and revenue growth.", style={'textAlign': 'center'})
         ])
     
     elif selected_analysis == 'visualization':
         # Data Storytelling & Visualization
+        revenue_by_country = cube.rollup('country', 'monthly_revenue').reset_index()
+        revenue_by_plan = cube.rollup('plan_type', 'monthly_revenue', where={'subscription_type': 'Pro'})
+        with phase('figure'):
+            scatter_fig = engagement_figure(view.frame)
+            country_fig = px.bar(revenue_by_country,
+                                 x='country', y='monthly_revenue',
+                                 title='Total Revenue by Country',
+                                 color_discrete_sequence=px.colors.qualitative.Pastel)
+            plan_fig = px.pie(revenue_by_plan, values=revenue_by_plan.values,
+                              names=revenue_by_plan.index,
+                              title='Revenue Distribution by Pro Plan',
+                              color_discrete_sequence=px.colors.qualitative.Pastel)
         return html.Div([
             html.H3("Interactive Charts", style={'textAlign': 'center'}),
-            dcc.Graph(figure=px.scatter(df, x='total_sessions', y='days_active', color='subscription_type',
-                                        title='User Engagement by Subscription Type',
-                                        color_discrete_sequence=px.colors.qualitative.Pastel)),
-            dcc.Graph(figure=px.bar(df.groupby('country')['monthly_revenue'].sum().reset_index(),
-                                    x='country', y='monthly_revenue',
-                                    title='Total Revenue by Country',
-                                    color_discrete_sequence=px.colors.qualitative.Pastel)),
-            dcc.Graph(figure=px.pie(df[df['subscription_type'] == 'Pro'].groupby('plan_type')['monthly_revenue'].sum(),
-                                    names=df[df['subscription_type'] == 'Pro']['plan_type'].unique(),
-                                    title='Revenue Distribution by Pro Plan',
-                                    color_discrete_sequence=px.colors.qualitative.Pastel))
+            dcc.Graph(figure=scatter_fig),
+            dcc.Graph(figure=country_fig),
+            dcc.Graph(figure=plan_fig)
         ])
     
     elif selected_analysis == 'comparison':
         # High-Engagement vs. Underpenetrated Markets
-        high_engagement = df.groupby('country')['total_sessions'].sum().nlargest(5).reset_index()
-        underpenetrated = df.groupby('country')['total_sessions'].sum().nsmallest(5).reset_index()
+        sessions_by_country = cube.rollup('country', 'total_sessions')
+        high_engagement = sessions_by_country.nlargest(5).reset_index()
+        underpenetrated = sessions_by_country.nsmallest(5).reset_index()
         high_engagement['market_type'] = 'High Engagement'
         underpenetrated['market_type'] = 'Underpenetrated'
         combined_data = pd.concat([high_engagement, underpenetrated])
         
-        fig = px.bar(combined_data, x='country', y='total_sessions', color='market_type',
-                      labels={'x': 'Country', 'y': 'Total Sessions'},
-                      title='High-Engagement vs. Underpenetrated Markets',
-                      color_discrete_sequence=px.colors.qualitative.Pastel)
+        with phase('figure'):
+            fig = px.bar(combined_data, x='country', y='total_sessions', color='market_type',
+                         labels={'x': 'Country', 'y': 'Total Sessions'},
+                         title='High-Engagement vs. Underpenetrated Markets',
+                         color_discrete_sequence=px.colors.qualitative.Pastel)
         return dcc.Graph(figure=fig, config={'toImageButtonOptions': {'format': 'png', 'filename': 'market_comparison'}})
 
+# Callback to update the graph based on dropdown selection. Heavy analyses are
+# rendered by the job pool, identical requests share one job, and the page polls
+# for progress and partial results until the response is ready
+app.callback(
+    [Output('graph-container', 'children'), Output('job-poll', 'disabled')],
+    [Input('analysis-dropdown', 'value'),
+     Input('country-filter', 'value'), Input('plan-filter', 'value'), Input('subscription-filter', 'value'),
+     Input('install-date-filter', 'start_date'), Input('install-date-filter', 'end_date'),
+     Input('data-version', 'data'), Input('job-poll', 'n_intervals')]
+)(background_analyses(job_runner, update_graph, BACKGROUND_ANALYSES))
+
 # Run the app
 if __name__ == '__main__':
     app.run_server(debug=True)
\ No newline at end of file
@@ -0,0 +1,15 @@
+# The committed serverless bundle must match the current app, data and code
+#
+# A stale api/bundle.json.gz is ignored at runtime and every request falls back
+# to the slow full app; rebuild it with `python -m growth.bundle api/index.py`.
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from growth.bundle import check_bundle
+
+
+def test_committed_bundle_is_up_to_date():
+    check_bundle(os.path.join(ROOT, 'api', 'index.py'))
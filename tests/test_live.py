@@ -0,0 +1,30 @@
+# Regression checks for live upserts (growth.live)
+#
+#   python -m pytest tests
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from growth.cleaning import clean_growth_data
+from growth.live import LiveDataset
+from growth.loader import load_growth_data
+
+CSV_PATH = os.path.join(ROOT, 'api', 'wppool_growth_data_sample_20k.csv')
+
+
+def test_partial_new_user_keeps_dtypes_and_cohorts_render():
+    dataset = LiveDataset(clean_growth_data(load_growth_data(CSV_PATH, use_cache=False))[0])
+    dtypes = dataset.frame.dtypes.to_dict()
+
+    # A new Free user, posted without pro_upgrade_date or plan_type
+    dataset.upsert([{'user_id': 99999999, 'install_date': '01/05/2024', 'last_active_date': '02/01/2024',
+                     'country': 'USA', 'subscription_type': 'Free', 'total_sessions': 3, 'page_views': 5,
+                     'download_clicks': 0, 'activation_status': 1, 'churned': 0, 'days_active': 27,
+                     'monthly_revenue': 0}])
+
+    assert dataset.frame.dtypes.to_dict() == dtypes
+    cohorts = dataset.cohorts()
+    assert cohorts.n_rows == len(dataset.frame)
+    assert cohorts.upgrade_time_by('engagement_level').notna().all()